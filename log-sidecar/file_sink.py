@@ -0,0 +1,146 @@
+import io
+import os
+import gzip
+import time
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator
+
+try:
+    import zstandard
+except ImportError:  # only needed for SIDECAR_FILE_COMPRESSION=zstd
+    zstandard = None
+
+logger = logging.getLogger("sidecar")
+
+FILE_DIR = os.environ.get("SIDECAR_FILE_DIR", "/tmp/sidecarArchive")
+FILE_MAX_BYTES = int(os.environ.get("SIDECAR_FILE_MAX_BYTES", 64 * 1024 * 1024))  # uncompressed bytes per segment
+FILE_MAX_AGE = float(os.environ.get("SIDECAR_FILE_MAX_AGE", 300.0))                 # seconds per segment
+FILE_COMPRESSION = os.environ.get("SIDECAR_FILE_COMPRESSION", "none").lower()       # none | gzip | zstd
+FILE_FSYNC = os.environ.get("SIDECAR_FILE_FSYNC", "rotate").lower()                 # batch | rotate | never
+WRITE_BUFFER = 1024 * 1024
+
+PART_SUFFIX = ".part"
+REPLAYED_SUFFIX = ".replayed"
+EXTENSIONS = {"none": ".ndjson", "gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+
+
+class RollingFileSink:
+    """Writes batches of NDJSON lines to segment files in `directory`, rotated by size and age.
+    Each batch is written with one large sequential write. Open segments end in .part and are renamed
+    once rotated, so only complete segments are picked up by replay.py.
+    Flush policy (fsync):
+    - batch: after every batch
+    - rotate: when a segment is completed
+    - never: leave it to the OS
+    Writes may come from several executor threads at once (see catch_up in main.py), so they are serialized."""
+
+    def __init__(
+        self,
+        directory=FILE_DIR,
+        max_bytes=FILE_MAX_BYTES,
+        max_age=FILE_MAX_AGE,
+        compression=FILE_COMPRESSION,
+        fsync=FILE_FSYNC,
+    ):
+        if compression == "zstd" and zstandard is None:
+            logger.error("zstandard is not installed, compressing file segments with gzip instead")
+            compression = "gzip"
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compression = compression
+        self.fsync = fsync
+        self.path = None
+        self.raw = None     # the segment file
+        self.stream = None  # what is written to, possibly compressing into self.raw
+        self.opened_at = 0.0
+        self.written = 0
+        self.sequence = 0
+        self.lock = threading.RLock()
+
+    def open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.sequence += 1
+        name = f"logs-{datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self.sequence:04d}"
+        self.path = self.directory / f"{name}{EXTENSIONS[self.compression]}{PART_SUFFIX}"
+        self.raw = open(self.path, mode="wb", buffering=WRITE_BUFFER)
+        if self.compression == "gzip":
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode="wb", compresslevel=6)
+        elif self.compression == "zstd":
+            self.stream = zstandard.ZstdCompressor().stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = self.raw
+        self.opened_at = time.monotonic()
+        self.written = 0
+
+    def close(self):
+        """Completes the current segment, if any."""
+        with self.lock:
+            if self.raw is None:
+                return
+            if self.stream is not self.raw:
+                self.stream.close()
+            self.raw.flush()
+            if self.fsync != "never":
+                os.fsync(self.raw.fileno())
+            self.raw.close()
+            completed = self.path.with_name(self.path.name.removesuffix(PART_SUFFIX))
+            os.replace(self.path, completed)
+            logger.info(f"Completed log segment {completed} ({self.written} bytes)")
+            self.raw = self.stream = self.path = None
+
+    def maybe_rotate(self):
+        with self.lock:
+            if self.raw is not None and (
+                self.written >= self.max_bytes or time.monotonic() - self.opened_at >= self.max_age
+            ):
+                self.close()
+
+    def write(self, lines: Iterable[bytes]) -> int:
+        """Writes a batch of NDJSON lines. Returns the number of bytes (uncompressed) written."""
+        data = b"".join(lines)
+        if not data:
+            return 0
+        with self.lock:
+            self.maybe_rotate()
+            if self.raw is None:
+                self.open()
+            self.stream.write(data)
+            self.written += len(data)
+            if self.fsync == "batch":
+                self.stream.flush()
+                self.raw.flush()
+                os.fsync(self.raw.fileno())
+        return len(data)
+
+
+def read_segment(path: Path) -> Iterator[bytes]:
+    """Yields the lines of a (possibly compressed) segment or spill file."""
+    with open(path, mode="rb") as raw:
+        if path.name.endswith(".gz"):
+            stream = gzip.GzipFile(fileobj=raw, mode="rb")
+        elif path.name.endswith(".zst"):
+            if zstandard is None:
+                raise RuntimeError(f"zstandard is needed to read {path}")
+            stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw), buffer_size=WRITE_BUFFER)
+        else:
+            stream = raw
+        for line in stream:
+            if line.strip():
+                yield line
+
+
+def find_segments(paths: Iterable[str]) -> list[Path]:
+    """Returns the completed, not yet replayed segment and spill files in `paths` (files or directories)."""
+    segments = []
+    for path in map(Path, paths):
+        candidates = sorted(path.iterdir()) if path.is_dir() else [path]
+        segments += [
+            candidate for candidate in candidates
+            if candidate.is_file() and ".ndjson" in candidate.name
+            and not candidate.name.endswith((PART_SUFFIX, REPLAYED_SUFFIX))
+        ]
+    return segments
@@ -2,15 +2,34 @@ import errno
 import os
 import json
 import time
+import array
+import fcntl
 import random
+import select
+import signal
+import socket
+import struct
 import asyncio
 import logging
+import termios
+import itertools
+import contextlib
 from datetime import datetime
-from collections import deque
+from collections import deque, defaultdict
 from pathlib import Path
+from typing import Iterable, Iterator
 
 import asyncpg
 
+try:
+    import msgpack
+except ImportError:  # only needed for msgpack encoded frames
+    msgpack = None
+
+from file_sink import RollingFileSink
+from profiling import install_signal_handlers, log_flush, stage_timer
+from routing import ACCESS_LOG_TABLE, APPLICATION_LOG_TABLE, route
+
 log_level = os.environ.get("SIDECAR_LOG_LEVEL", logging.WARN)
 logging.basicConfig(level=log_level)
 logger = logging.getLogger("sidecar")
@@ -22,47 +41,326 @@ BACKOFF_INITIAL = float(os.environ.get("SIDECAR_BACKOFF_INITIAL", 2.0))   # seco
 BACKOFF_MAX = float(os.environ.get("SIDECAR_BACKOFF_MAX", 60.0))          # seconds
 BACKOFF_FACTOR = float(os.environ.get("SIDECAR_BACKOFF_FACTOR", 2.0))     # multiplier
 DB_TIMEOUT = 8.0
+MAX_DATA_BYTES = int(os.environ.get("SIDECAR_MAX_DATA_BYTES", 0))           # 0 = unlimited
+OVERSIZE_DATA = os.environ.get("SIDECAR_OVERSIZE_DATA", "truncate").lower()  # truncate | drop
+SHUTDOWN_DEADLINE = float(os.environ.get("SIDECAR_SHUTDOWN_DEADLINE", 20.0))  # seconds, < pod grace period
+SHUTDOWN_BATCH_SIZE = int(os.environ.get("SIDECAR_SHUTDOWN_BATCH_SIZE", 5000))
+SPILL_DIR = os.environ.get("SIDECAR_SPILL_DIR", "/tmp/sidecarSpill")
+BUFFER_MODE = os.environ.get("SIDECAR_BUFFER_MODE", "objects").lower()        # objects | raw
+BUFFER_MAX_SIZE = int(os.environ.get("SIDECAR_BUFFER_MAX_SIZE", 1000))                # logs, objects mode only
+BUFFER_MAX_BYTES = int(os.environ.get("SIDECAR_BUFFER_MAX_BYTES", 32 * 1024 * 1024))  # raw mode only
+SEGMENT_SIZE = int(os.environ.get("SIDECAR_SEGMENT_SIZE", 100))                       # logs, objects mode only
+SEGMENT_BYTES = int(os.environ.get("SIDECAR_SEGMENT_BYTES", 256 * 1024))              # raw mode only
+LOG_PIPE_PROTOCOL = os.environ.get("LOG_PIPE_PROTOCOL", "ndjson").lower()              # ndjson | framed
+MAX_RECORD_BYTES = int(os.environ.get("SIDECAR_MAX_RECORD_BYTES", 16 * 1024 * 1024))  # framed protocol only
+READ_SIZE = 64 * 1024
+SINK = os.environ.get("SIDECAR_SINK", "db").lower()  # db | file | both
+CATCHUP_THRESHOLD = float(os.environ.get("SIDECAR_CATCHUP_THRESHOLD", 0.5))   # share of the buffer filled, 0 = disabled
+CATCHUP_CONCURRENCY = int(os.environ.get("SIDECAR_CATCHUP_CONCURRENCY", 4))    # concurrent COPY streams
+CATCHUP_BATCH_SIZE = int(os.environ.get("SIDECAR_CATCHUP_BATCH_SIZE", 0))      # logs per COPY stream, 0 = derived
+CATCHUP_CYCLES = 2  # cycles the buffer has to stay above the threshold after sending before catching up
+SOCKET_MODE = os.environ.get("SIDECAR_SOCKET", "none").lower()                       # none | stream | datagram | both
+DATAGRAM_BATCH = int(os.environ.get("SIDECAR_DATAGRAM_BATCH", 256))                  # datagrams per wakeup
+SOCKET_DRAIN_SECONDS = 0.5
+MAX_DATAGRAM = 1024 * 1024
+MAX_DGRAM_QLEN = "/proc/sys/net/unix/max_dgram_qlen"
+STREAM_SOCKET_PATH = FIFO_PATH + ".sock"
+DATAGRAM_SOCKET_PATH = FIFO_PATH + ".dgram"
+ADAPTIVE = os.environ.get("SIDECAR_ADAPTIVE", "0") == "1"
+LATENCY_TARGET = float(os.environ.get("SIDECAR_LATENCY_TARGET_MS", 500.0)) / 1000  # seconds
+BATCH_MIN = int(os.environ.get("SIDECAR_BATCH_MIN", 100))
+BATCH_MAX = int(os.environ.get("SIDECAR_BATCH_MAX", 10000))
+BATCH_STEP = int(os.environ.get("SIDECAR_BATCH_STEP", 100))                     # additive increase
+INTERVAL_MIN = float(os.environ.get("SIDECAR_INTERVAL_MIN", 0.5))               # seconds
+STATUS_FILE = os.environ.get("SIDECAR_STATUS_FILE")
+
+# Framed protocol, see FrameDecoder. Must match test-api/logger.py
+FRAME_HEADER = struct.Struct(">2sBBII")  # magic, encoding, flags, stream id, payload length
+FRAME_MAGIC = b"LS"
+ENCODING_JSON = 0
+ENCODING_MSGPACK = 1
+FLAG_MORE = 1          # more fragments of this record follow
+FLAG_CONTINUATION = 2  # not the first fragment of this record
+MAX_FRAME_PAYLOAD = select.PIPE_BUF - FRAME_HEADER.size  # writers keep frames within PIPE_BUF
 
 logger.debug("LOG LEVEL set to debug")
 logger.debug(f"FIFO PATH: {FIFO_PATH}")
 logger.debug(f"SENDING INTERVAL : {str(SENDING_INTERVAL)}")
+logger.debug(f"MAX DATA BYTES: {str(MAX_DATA_BYTES)} ({OVERSIZE_DATA})")
+logger.debug(f"SHUTDOWN DEADLINE: {str(SHUTDOWN_DEADLINE)}")
+logger.debug(f"BUFFER MODE: {BUFFER_MODE}")
+logger.debug(f"PIPE PROTOCOL: {LOG_PIPE_PROTOCOL}")
+logger.debug(f"SOCKET: {SOCKET_MODE}")
+logger.debug(f"SINK: {SINK}")
+logger.debug(f"CATCHUP THRESHOLD: {str(CATCHUP_THRESHOLD)}, CONCURRENCY: {str(CATCHUP_CONCURRENCY)}")
+logger.debug(f"ADAPTIVE: {str(ADAPTIVE)}, LATENCY TARGET: {str(LATENCY_TARGET)}")
 
 host = os.environ.get("LOG_DB_HOST", "timescale_db")
 port = os.environ.get("LOG_DB_PORT", 5432)
 user = os.environ.get("LOG_DB_USER", "log_api_user")
 database = os.environ.get("LOG_DB_NAME", "logs")
 password = os.environ.get("LOG_DB_PASSWORD")
-if not password:
+if not password and SINK != "file":
     raise Exception("No password set for log_api_user. Please set via the LOG_DB_PASSWORD env variable.")
 
 
+class Segment:
+    """Fixed size block of decoded logs. Filled by the collector and handed to the sender as a whole."""
+
+    __slots__ = ("items", "count", "archived")
+
+    def __init__(self, size: int):
+        self.items = [None] * size
+        self.count = 0
+        self.archived = False  # written to the file sink already
+
+    def append(self, log_in: dict) -> bool:
+        """Returns False if the segment is full."""
+        if self.count == len(self.items):
+            return False
+        self.items[self.count] = log_in
+        self.count += 1
+        return True
+
+    def logs(self) -> Iterator[dict]:
+        return itertools.islice(self.items, self.count)
+
+    def reset(self):
+        self.items[:self.count] = itertools.repeat(None, self.count)
+        self.count = 0
+        self.archived = False
+
+
+class RawSegment:
+    """Fixed size block of raw NDJSON lines, stored back to back in a preallocated bytearray.
+    The lines are only decoded right before sending (see send_logs_to_db)."""
+
+    __slots__ = ("data", "ends", "count", "used", "capacity", "archived")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.data = bytearray(capacity)
+        self.ends = array.array("I", bytes(4 * max(capacity // 64, 1)))  # end offset of each line
+        self.count = 0
+        self.used = 0
+        self.archived = False  # written to the file sink already
+
+    def append(self, log_in: bytes) -> bool:
+        """Returns False if the segment is full. A single line larger than the segment
+        is accepted into an empty segment, which grows until it is reset."""
+        size = len(log_in)
+        if self.count == len(self.ends) or (self.count and self.used + size > self.capacity):
+            return False
+        self.data[self.used:self.used + size] = log_in
+        self.used += size
+        self.ends[self.count] = self.used
+        self.count += 1
+        return True
+
+    def logs(self) -> Iterator[bytes]:
+        start = 0
+        with memoryview(self.data) as view:
+            for end in itertools.islice(self.ends, self.count):
+                yield bytes(view[start:end])
+                start = end
+
+    def reset(self):
+        if len(self.data) > self.capacity:
+            del self.data[self.capacity:]
+        self.count = 0
+        self.used = 0
+        self.archived = False
+
+
 class Buffer:
-    """In-memory bounded buffer for logs with async lock."""
+    """In-memory bounded ring of fixed size segments:
+    - the collectors (FIFO reader, one task per stream connection, datagram reader) append to the open segment
+    - the sender and concurrent catch_up_batch tasks take whole segments and ack (release) or nack (return)
+      them after sending
+    There is no lock. This is only safe because all of them run on the event loop thread and no method awaits,
+    so append / take / ack / nack must never be called from an executor or another thread.
+    Taken segments belong to the task that took them until it acks or nacks them, so they can be read elsewhere
+    (see archive_segments).
+    Up to max_segments segments wait to be sent. Segments taken by the sender don't count against that,
+    so the collectors keep accepting logs for the length of a DB round trip; hence up to twice as many segments
+    are allocated on demand, and recycled afterwards.
+    If max_segments segments are waiting, the oldest of them is dropped."""
 
-    def __init__(self, interval=5, max_size=1000):
+    def __init__(self, interval=5, max_segments=10, segment_size=100, raw=False):
         self.interval = interval
-        self.lock = asyncio.Lock()
-        self.buf = deque(maxlen=max_size)
-        self.max_size = max_size
+        self.raw = raw
+        self.max_segments = max_segments
+        self.segment_size = segment_size
+        self.allocated = 0
+        self.open = None        # segment the collector appends to
+        self.pending = deque()  # filled segments, oldest first
+        self.free = []          # released segments ready for reuse
+        self.count = 0          # logs in open and pending segments
+        self.in_flight = 0      # logs in segments taken by the sender
         self.dropped = 0
 
-    async def add(self, log_in: dict):
-        async with self.lock:
-            # deque(maxlen=N) automatically drops oldest item if full
-            if len(self.buf) == self.max_size:
-                self.dropped += 1
-            self.buf.append(log_in)
+    def append(self, log_in: dict | bytes):
+        if self.open is not None and self.open.append(log_in):
+            self.count += 1
+            return
+        if self.open is not None:
+            self.pending.append(self.open)
+        self.open = self._next_segment()
+        if self.open is None:
+            # every segment is in flight
+            self.dropped += 1
+            return
+        self.open.append(log_in)
+        self.count += 1
+
+    def _next_segment(self) -> Segment | RawSegment | None:
+        if len(self.pending) < self.max_segments:
+            if self.free:
+                return self.free.pop()
+            if self.allocated < 2 * self.max_segments:
+                self.allocated += 1
+                return RawSegment(self.segment_size) if self.raw else Segment(self.segment_size)
+        if self.pending:
+            oldest = self.pending.popleft()
+            self.count -= oldest.count
+            self.dropped += oldest.count
+            oldest.reset()
+            return oldest
+        return None
+
+    def take(self, limit: int | None = None, max_segments: int | None = None) -> list[Segment | RawSegment]:
+        """Hands over whole segments, oldest first, with up to `limit` logs (but at least one segment)
+        and up to `max_segments` segments.
+        The open segment is handed over too, if everything pending fits into the limits."""
+        if (
+            self.open is not None and self.open.count
+            and (limit is None or self.count - self.open.count < limit)
+            and (max_segments is None or len(self.pending) < max_segments)
+        ):
+            self.pending.append(self.open)
+            self.open = None
+        taken = []
+        count = 0
+        while self.pending and (max_segments is None or len(taken) < max_segments) and (
+            limit is None or not taken or count + self.pending[0].count <= limit
+        ):
+            segment = self.pending.popleft()
+            taken.append(segment)
+            count += segment.count
+        self.count -= count
+        self.in_flight += count
+        return taken
+
+    def ack(self, segments: list[Segment | RawSegment]):
+        """Releases sent segments for reuse."""
+        for segment in segments:
+            self.in_flight -= segment.count
+            segment.reset()
+            self.free.append(segment)
 
-    async def remove_left(self, count: int):
-        async with self.lock:
-            for _ in range(min(count, len(self.buf))):
-                self.buf.popleft()
+    def nack(self, segments: list[Segment | RawSegment]):
+        """Returns segments that could not be sent to the front of the ring."""
+        for segment in reversed(segments):
+            self.in_flight -= segment.count
+            self.count += segment.count
+            self.pending.appendleft(segment)
+
+    def __len__(self):
+        return self.count + self.in_flight
+
+    def fill(self) -> float:
+        """Share of the ring filled with logs waiting to be sent."""
+        filled = len(self.pending) + (self.open is not None and self.open.count > 0)
+        return filled / self.max_segments
 
     def send_logs_every(self):
         jitter = random.randint(1, 9) * 0.1
         return self.interval + jitter
 
 
+def segment_logs(segments: list[Segment | RawSegment]) -> Iterator[dict | bytes]:
+    return itertools.chain.from_iterable(segment.logs() for segment in segments)
+
+
+TRUNCATION_MARKER = b'{"truncated": true, "size": '
+
+
+def cap_data(data: bytes) -> bytes | None:
+    """Applies SIDECAR_MAX_DATA_BYTES to a raw data payload.
+    Oversized payloads are either dropped or replaced by a (valid JSON) truncation marker.
+    Markers are kept as they are, since raw mode caps a log when buffering it and again when decoding it for the DB."""
+    if not MAX_DATA_BYTES or len(data) <= MAX_DATA_BYTES or data.startswith(TRUNCATION_MARKER):
+        return data
+    if OVERSIZE_DATA == "drop":
+        logger.info(f"Dropped data payload of {len(data)} bytes")
+        return None
+    preview = data[:MAX_DATA_BYTES].decode(errors="ignore")
+    return json.dumps({"truncated": True, "size": len(data), "preview": preview}).encode()
+
+
+def is_msgpack(line: bytes) -> bool:
+    """msgpack encoded logs start with a map marker, which can never start a JSON line."""
+    return len(line) > 0 and (0x80 <= line[0] <= 0x8f or line[0] in (0xde, 0xdf))
+
+
+def encode_payload(data) -> bytes | None:
+    """Encodes a decoded data payload into the JSON bytes handed to the DB (see encode_jsonb), capped by cap_data.
+    Values JSONB cannot store (NaN / Infinity, \\u0000) would fail the whole batch, so they are nulled out."""
+    if not data:
+        return None
+    try:
+        encoded = json.dumps(data, allow_nan=False).encode()
+    except (TypeError, ValueError) as e:
+        logger.error(f"Dropped data payload: {e}")
+        return None
+    if b"\\u0000" in encoded:
+        logger.error("Dropped data payload: contains \\u0000")
+        return None
+    return cap_data(encoded)
+
+
+def decode_log(line: bytes) -> dict:
+    """Decodes a log line, which fails on invalid JSON. The "data" payload is encoded once, right here,
+    and kept as JSON bytes, which are handed to the DB as they are (see encode_jsonb).
+    The C decoder / encoder beat scanning the line for the raw "data" span at any payload size.
+    msgpack encoded logs (framed protocol) are decoded the same way."""
+    if is_msgpack(line):
+        if msgpack is None:
+            raise ValueError("Received a msgpack encoded log, but msgpack is not installed")
+        log = msgpack.unpackb(line)
+    else:
+        log = json.loads(line)
+    if isinstance(log, dict):
+        log["data"] = encode_payload(log.get("data"))
+    return log
+
+
+def encode_data(data) -> bytes | None:
+    """Returns the data payload as JSON bytes. Raw payloads are passed through untouched."""
+    if isinstance(data, bytes):
+        return data
+    return json.dumps(data).encode()
+
+
+def encode_log(log: dict) -> bytes:
+    """Encodes a decoded log back into a JSON line, splicing a raw data payload back in as it is."""
+    data = log.get("data")
+    if not isinstance(data, bytes):
+        return json.dumps(log).encode() + b"\n"
+    rest = json.dumps({k: v for k, v in log.items() if k != "data"}).encode()
+    separator = b", " if len(rest) > 2 else b""
+    return rest[:-1] + separator + b'"data": ' + data + b"}\n"
+
+
+def encode_jsonb(data: bytes) -> bytes:
+    """Binary JSONB wire format: a version byte followed by the JSON text."""
+    return b"\x01" + data
+
+
+def decode_jsonb(data: bytes) -> bytes:
+    return data[1:]
+
+
 def prep_access_log(log: dict) -> tuple | None:
     """This function takes the read log dict and outputs an access_log formatted tuple.
     The tuple is ready for injecting to db with asyncpg"""
@@ -93,7 +391,7 @@ def prep_access_log(log: dict) -> tuple | None:
         data = log.get("data")
         if data:
             try:
-                data = json.dumps(data)
+                data = encode_data(data)
             except TypeError as e:
                 logger.error(f"Failed to serialize data for access log: {e}")
                 data = None
@@ -141,7 +439,7 @@ def prep_application_log(log: dict) -> tuple | None:
         data = log.get("data")
         if data:
             try:
-                data = json.dumps(data)
+                data = encode_data(data)
             except TypeError as e:
                 logger.error(f"Failed to serialize data for application log: {e}")
                 data = None
@@ -151,53 +449,93 @@ def prep_application_log(log: dict) -> tuple | None:
         return None
 
 
-async def send_access_logs(con, access_logs: list[tuple]):
-    table_name = os.environ.get("ACCESS_LOG_TABLE", "access_logs")
+ACCESS_LOG_COLUMNS = (
+    "time", "application_name", "environment_name", "trace_id", "host_ip", "remote_ip_address", "username",
+    "request_method", "request_path", "response_status", "response_size", "duration", "data",
+)
+APPLICATION_LOG_COLUMNS = (
+    "time", "application_name", "environment_name", "trace_id", "host_ip", "username", "level", "file_path",
+    "message", "data",
+)
+
+
+async def init_connection(con):
+    await con.set_type_codec(
+        "jsonb", schema="pg_catalog", encoder=encode_jsonb, decoder=decode_jsonb, format="binary"
+    )
+
+
+async def send_access_logs(con, access_logs: list[tuple], table_name: str = ACCESS_LOG_TABLE, on_conflict: str = ""):
     await con.executemany(
         f"""
         INSERT INTO {table_name}(
         time, application_name, environment_name, trace_id, host_ip, remote_ip_address, username, request_method,
          request_path, response_status, response_size, duration, data)
-                  VALUES($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)
+                  VALUES($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13) {on_conflict}
         """,
         access_logs,
         timeout=DB_TIMEOUT,
     )
 
 
-async def send_application_logs(con, app_logs: list[tuple]):
-    table_name = os.environ.get("APPLICATION_LOG_TABLE", "application_logs")
+async def send_application_logs(
+    con, app_logs: list[tuple], table_name: str = APPLICATION_LOG_TABLE, on_conflict: str = ""
+):
     await con.executemany(
         f"""
         INSERT INTO {table_name}(time, application_name, environment_name, trace_id, host_ip, username, level,
          file_path, message, data)
-                  VALUES($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+                  VALUES($1, $2, $3, $4, $5, $6, $7, $8, $9, $10) {on_conflict}
         """,
         app_logs,
         timeout=DB_TIMEOUT,
     )
 
 
-async def send_logs_to_db(logs: list[dict]) -> bool:
-    access_logs = []
-    application_logs = []
+def prep_logs(logs: Iterable[dict | bytes]) -> tuple[dict[str, list[tuple]], dict[str, list[tuple]], int]:
+    """Preps a batch of logs, grouped per target table (see routing.py), so each insert stays single-table.
+    Raw lines (from raw segments) are decoded here.
+    Returns access logs and application logs per table and the number of prepped logs."""
+    access_logs = defaultdict(list)
+    application_logs = defaultdict(list)
+    count = 0
 
     for i in logs:
-        if "type" not in i:
+        if isinstance(i, bytes):
+            try:
+                i = decode_log(i)
+            except ValueError as e:
+                logger.error(f"Cannot decode log: {e}")
+                continue
+        if not i or "type" not in i:
             continue
         if i["type"].lower() == "access":
             prepped = prep_access_log(log=i)
             if prepped is not None:
-                access_logs.append(prepped)
+                access_logs[route(prepped[1], prepped[2])[0]].append(prepped)
+                count += 1
         elif i["type"].lower() == "application":
             prepped = prep_application_log(log=i)
             if prepped is not None:
-                application_logs.append(prepped)
+                application_logs[route(prepped[1], prepped[2])[1]].append(prepped)
+                count += 1
         else:
             logger.info("Cannot send logs other than type access or application")
+    return access_logs, application_logs, count
+
 
-    if len(access_logs) == 0 and len(application_logs) == 0:
+async def send_logs_to_db(
+    logs: Iterable[dict | bytes], skip_duplicates: bool = False, stages: dict[str, float] | None = None
+) -> bool:
+    """Preps and sends a batch of logs.
+    All inserts of a batch run in one transaction, so a failed batch can be retried as a whole.
+    With `skip_duplicates`, logs that are in the DB already are skipped (ON CONFLICT DO NOTHING), see replay.py.
+    The time spent per stage (prep, connect, insert) is added to `stages`, if given."""
+    started = time.perf_counter()
+    access_logs, application_logs, count = prep_logs(logs)
+    if count == 0:
         return True
+    prepped_at = time.perf_counter()
 
     con = None
     try:
@@ -211,15 +549,27 @@ async def send_logs_to_db(logs: list[dict]) -> bool:
             command_timeout=DB_TIMEOUT,
         )
         logger.debug(f"Connected with host {host}, user {user}, db {database}")
+        await init_connection(con)
+        connected_at = time.perf_counter()
 
-        if len(access_logs) > 0:
-            await send_access_logs(con, access_logs)
-            logger.debug(f"sent {len(access_logs)} access_logs")
+        on_conflict = "ON CONFLICT DO NOTHING" if skip_duplicates else ""
+        async with con.transaction():
+            for table_name, rows in access_logs.items():
+                await send_access_logs(con, rows, table_name, on_conflict)
+                logger.debug(f"sent {len(rows)} access_logs to {table_name}")
 
-        if len(application_logs) > 0:
-            await send_application_logs(con, application_logs)
-            logger.debug(f"sent {len(application_logs)} application_logs")
+            for table_name, rows in application_logs.items():
+                await send_application_logs(con, rows, table_name, on_conflict)
+                logger.debug(f"sent {len(rows)} application_logs to {table_name}")
 
+        flush_stages = {
+            "prep": prepped_at - started,
+            "connect": connected_at - prepped_at,
+            "insert": time.perf_counter() - connected_at,
+        }
+        log_flush(count, flush_stages)
+        if stages is not None:
+            stages.update(flush_stages)
         return True
 
     except Exception as e:
@@ -234,44 +584,359 @@ async def send_logs_to_db(logs: list[dict]) -> bool:
                 pass
 
 
-async def schedule_log_sending(buffered_logs: Buffer):
+pool = None
+
+
+async def get_pool() -> asyncpg.Pool:
+    """Connection pool for catching up, created on first use and capped at CATCHUP_CONCURRENCY connections."""
+    global pool
+    if pool is None:
+        pool = await asyncpg.create_pool(
+            host=host,
+            port=port,
+            user=user,
+            password=password,
+            database=database,
+            min_size=0,
+            max_size=CATCHUP_CONCURRENCY,
+            init=init_connection,
+            timeout=DB_TIMEOUT,
+            command_timeout=DB_TIMEOUT,
+        )
+    return pool
+
+
+async def copy_logs_to_db(db_pool: asyncpg.Pool, logs: Iterable[dict | bytes]) -> bool:
+    """Like send_logs_to_db, but with COPY over a pooled connection, for catching up on a backlog."""
+    started = time.perf_counter()
+    access_logs, application_logs, count = prep_logs(logs)
+    if count == 0:
+        return True
+    prepped_at = time.perf_counter()
+
+    try:
+        async with db_pool.acquire() as con:
+            connected_at = time.perf_counter()
+            async with con.transaction():
+                for table_name, rows in access_logs.items():
+                    await con.copy_records_to_table(
+                        table_name, records=rows, columns=ACCESS_LOG_COLUMNS, timeout=DB_TIMEOUT
+                    )
+                for table_name, rows in application_logs.items():
+                    await con.copy_records_to_table(
+                        table_name, records=rows, columns=APPLICATION_LOG_COLUMNS, timeout=DB_TIMEOUT
+                    )
+        log_flush(
+            count,
+            {
+                "prep": prepped_at - started,
+                "connect": connected_at - prepped_at,
+                "copy": time.perf_counter() - connected_at,
+            },
+        )
+        return True
+
+    except Exception as e:
+        logger.error(f"DB copy failed: {e}")
+        return False
+
+
+file_sink = RollingFileSink() if SINK in ("file", "both") else None
+
+
+def archive_segments(segments: list[Segment | RawSegment]):
+    """Writes the segments that were not archived yet to the file sink, as one large write."""
+    lines = [to_ndjson(log) for segment in segments if not segment.archived for log in segment.logs()]
+    file_sink.write(lines)
+    for segment in segments:
+        segment.archived = True
+
+
+async def send_segments(
+    segments: list[Segment | RawSegment], db_pool: asyncpg.Pool | None = None, stages: dict[str, float] | None = None
+) -> bool:
+    """Sends segments to the configured sink(s), see SIDECAR_SINK. With a pool, they are copied (see catch_up).
+    With both sinks, segments are archived only once, even if the DB insert fails and they are sent again.
+    The archive is a side channel then: if writing it fails, the logs are still sent to the DB."""
+    if file_sink is not None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, archive_segments, segments)
+        except Exception as e:
+            logger.error(f"Writing logs to file failed: {e}")
+            if SINK == "file":
+                return False
+    if SINK == "file":
+        return True
+    if db_pool is not None:
+        return await copy_logs_to_db(db_pool, logs=segment_logs(segments))
+    return await send_logs_to_db(logs=segment_logs(segments), stages=stages)
+
+
+async def catch_up_batch(buffered_logs: Buffer, segments: list[Segment | RawSegment], db_pool: asyncpg.Pool) -> bool:
+    ok = False
+    try:
+        ok = await send_segments(segments, db_pool)
+    except asyncio.CancelledError:
+        buffered_logs.nack(segments)
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected send failure: {e}")
+    if ok:
+        buffered_logs.ack(segments)
+    else:
+        buffered_logs.nack(segments)
+    return ok
+
+
+def take_catch_up_batch(buffered_logs: Buffer) -> list[Segment | RawSegment]:
+    """Takes the segments of one COPY stream: SIDECAR_CATCHUP_BATCH_SIZE logs if set,
+    otherwise an even share of the catch-up threshold, in whole segments (so that it works in raw mode, too)."""
+    if CATCHUP_BATCH_SIZE:
+        return buffered_logs.take(CATCHUP_BATCH_SIZE)
+    share = max(int(buffered_logs.max_segments * CATCHUP_THRESHOLD / CATCHUP_CONCURRENCY), 1)
+    return buffered_logs.take(max_segments=share)
+
+
+async def catch_up(buffered_logs: Buffer, stopping: asyncio.Event) -> bool:
+    """Drains a backlog (e.g. after a DB outage) with up to CATCHUP_CONCURRENCY concurrent COPY streams over pooled
+    connections, without sleeping in between, until the buffer is filled less than SIDECAR_CATCHUP_THRESHOLD.
+    Batches are independent, so the ones that went through are released even if others failed.
+    Returns False if any batch failed, so that the caller backs off instead of hammering a recovering DB."""
+    logger.info(f"Catching up on {buffered_logs.count} buffered logs with {CATCHUP_CONCURRENCY} streams")
+    try:
+        db_pool = await get_pool()
+    except Exception as e:
+        logger.error(f"DB pool failed: {e}")
+        return False
+
+    sent = 0
+    while buffered_logs.fill() >= CATCHUP_THRESHOLD and not stopping.is_set():
+        batches = []
+        for _ in range(CATCHUP_CONCURRENCY):
+            segments = take_catch_up_batch(buffered_logs)
+            if not segments:
+                break
+            batches.append(segments)
+        counts = [sum(segment.count for segment in segments) for segments in batches]
+        results = await asyncio.gather(*(catch_up_batch(buffered_logs, segments, db_pool) for segments in batches))
+        sent += sum(count for count, ok in zip(counts, results) if ok)
+        if not all(results):
+            logger.warning(f"Catching up failed after {sent} logs, {len(buffered_logs)} left")
+            return False
+    logger.info(f"Caught up on {sent} logs, back to normal sending")
+    return True
+
+
+async def wait_or_stop(stopping: asyncio.Event, seconds: float) -> None:
+    """Sleeps for `seconds`, but wakes up as soon as `stopping` is set."""
+    try:
+        await asyncio.wait_for(stopping.wait(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+class AdaptiveController:
+    """AIMD style controller for batch size and flush interval, driven by the observed commit latency
+    (the insert transaction, without prepping and connecting).
+    - smoothed latency below target => batch size grows by BATCH_STEP and the interval shortens
+    - smoothed latency above target => both back off in proportion to how far the latency is above the target
+    Hard failures are still handled by the exponential backoff in schedule_log_sending.
+    Batches are made of whole segments, at least one, so in raw mode (a segment holds many logs)
+    the batch size only takes effect in steps of a segment."""
+
+    def __init__(
+        self,
+        target=LATENCY_TARGET,
+        batch_min=BATCH_MIN,
+        batch_max=BATCH_MAX,
+        interval_min=INTERVAL_MIN,
+        interval_max=SENDING_INTERVAL,
+    ):
+        self.target = target
+        self.batch_min = batch_min
+        self.batch_max = batch_max
+        self.interval_min = interval_min
+        self.interval_max = interval_max
+        self.batch_size = batch_min
+        self.interval = float(interval_max)
+        self.latency = None  # exponentially weighted moving average, seconds
+
+    def observe(self, latency: float):
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if self.latency <= self.target:
+            self.batch_size = min(self.batch_size + BATCH_STEP, self.batch_max)
+            self.interval = max(self.interval * 0.8, self.interval_min)
+        else:
+            overshoot = self.latency / self.target
+            self.batch_size = max(int(self.batch_size / overshoot), self.batch_min)
+            self.interval = min(self.interval * overshoot, self.interval_max)
+        if STATUS_FILE:
+            self.write_status(STATUS_FILE)
+
+    def send_logs_every(self):
+        jitter = random.uniform(0.02, 0.18) * self.interval
+        return self.interval + jitter
+
+    def stats(self) -> dict:
+        return {
+            "batch_size": self.batch_size,
+            "interval": round(self.interval, 3),
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "latency_target_ms": round(self.target * 1000, 1),
+        }
+
+    def write_status(self, path: str):
+        """Writes the current parameters as JSON, replacing the file atomically."""
+        try:
+            with open(f"{path}.tmp", mode="w") as f:
+                json.dump(self.stats(), f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.error(f"Failed to write status file {path}: {e}")
+
+
+async def schedule_log_sending(buffered_logs: Buffer, stopping: asyncio.Event):
     """Schedules sending logs to db. Uses exponential backoff on DB failures.
     - Success => reset to normal interval
     - Failure => increase delay up to BACKOFF_MAX
+    With SIDECAR_ADAPTIVE=1, batch size and interval are chosen by an AdaptiveController instead,
+    and the next batch is sent right away while a full batch is waiting.
+    Once there is a backlog, i.e. the buffer is filled above SIDECAR_CATCHUP_THRESHOLD after a failed send or after
+    CATCHUP_CYCLES sends in a row, it is drained by catch_up instead.
+    Returns once `stopping` is set, the rest is left to flush_on_shutdown.
     """
 
+    controller = AdaptiveController() if ADAPTIVE else None
     backoff = BACKOFF_INITIAL
-    while True:
-        to_send = None
-        sleep_for = buffered_logs.send_logs_every()
+    behind = 0  # cycles in a row that ended with the buffer filled above the catch-up threshold
+    while not stopping.is_set():
+        # a healthy sender may well take half the buffer per cycle, so that alone is no backlog
+        if (
+            CATCHUP_THRESHOLD
+            and SINK != "file"
+            and buffered_logs.fill() >= CATCHUP_THRESHOLD
+            and (backoff > BACKOFF_INITIAL or behind >= CATCHUP_CYCLES)
+        ):
+            ok = await catch_up(buffered_logs, stopping)
+            behind = 0
+            if not ok:
+                await wait_or_stop(stopping, backoff + random.random() * 0.5)
+                backoff = min(backoff * BACKOFF_FACTOR, BACKOFF_MAX)
+                continue
+            backoff = BACKOFF_INITIAL
 
-        async with buffered_logs.lock:
-            if len(buffered_logs.buf) > 0:
-                # snapshot current buffer
-                to_send = list(buffered_logs.buf)
+        if controller is None:
+            sleep_for = buffered_logs.send_logs_every()
+            # take over all filled segments of the ring buffer
+            segments = buffered_logs.take()
+        else:
+            sleep_for = controller.send_logs_every()
+            segments = buffered_logs.take(controller.batch_size)
 
-        if to_send:
+        if segments:
+            count = sum(segment.count for segment in segments)
             ok = False
+            sent_at = time.perf_counter()
+            stages = {}
             try:
-                ok = await send_logs_to_db(logs=to_send)
+                ok = await send_segments(segments, stages=stages)
+            except asyncio.CancelledError:
+                buffered_logs.nack(segments)
+                raise
             except Exception as e:
                 logger.error(f"Unexpected send failure: {e}")
 
             if ok:
-                # remove the logs we sent from ring buffer
-                await buffered_logs.remove_left(count=len(to_send))
+                # release the segments we sent
+                buffered_logs.ack(segments)
                 backoff = BACKOFF_INITIAL  # reset backoff after success
-                logger.debug(f"Sent {len(to_send)} logs. Next send in ~{sleep_for:.1f}s")
+                if controller is not None:
+                    if "insert" in stages:
+                        controller.observe(stages["insert"])
+                    elif SINK == "file":
+                        controller.observe(time.perf_counter() - sent_at)
+                    if buffered_logs.count >= controller.batch_size:
+                        sleep_for = 0
+                    logger.debug(f"Adaptive sending: {controller.stats()}")
+                logger.debug(f"Sent {count} logs. Next send in ~{sleep_for:.1f}s")
+                stage_timer.maybe_report()
             else:
-                async with buffered_logs.lock:
-                    logger.warning(
-                        f"DB unavailable / insert failed. Keeping {len(buffered_logs.buf)} buffered logs "
-                        f"(dropped_total={buffered_logs.dropped})"
-                    )
+                buffered_logs.nack(segments)
+                logger.warning(
+                    f"DB unavailable / insert failed. Keeping {len(buffered_logs)} buffered logs "
+                    f"(dropped_total={buffered_logs.dropped})"
+                )
                 sleep_for = backoff + random.random() * 0.5
                 backoff = min(backoff * BACKOFF_FACTOR, BACKOFF_MAX)
+        elif file_sink is not None:
+            # rotate idle segments by age too
+            await asyncio.get_running_loop().run_in_executor(None, file_sink.maybe_rotate)
+
+        behind = behind + 1 if CATCHUP_THRESHOLD and buffered_logs.fill() >= CATCHUP_THRESHOLD else 0
+        await wait_or_stop(stopping, sleep_for)
+
+
+def to_ndjson(log: dict | bytes) -> bytes:
+    """Returns a buffered log as a JSON line, raw JSON lines are returned as they are."""
+    if isinstance(log, bytes):
+        if not is_msgpack(log):
+            return log if log.endswith(b"\n") else log + b"\n"
+        log = decode_log(log)
+    return encode_log(log)
+
+
+def spill_logs(logs: Iterable[dict | bytes]) -> Path | None:
+    """Writes logs to a NDJSON file in SPILL_DIR, so they are not lost on shutdown."""
+    spill_file = Path(SPILL_DIR) / f"spill-{datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.ndjson"
+    lines = [to_ndjson(log) for log in logs]
+    try:
+        spill_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(spill_file, mode="wb") as f:
+            f.write(b"".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+    except Exception as e:
+        logger.error(f"Failed to spill {len(lines)} logs to {spill_file}: {e}")
+        return None
+    logger.warning(f"Spilled {len(lines)} unsent logs to {spill_file}")
+    return spill_file
 
-        await asyncio.sleep(sleep_for)
+
+async def flush_on_shutdown(buffered_logs: Buffer, deadline: float):
+    """Sends everything left in the buffer in large batches, bypassing interval and jitter.
+    Whatever is still buffered at the deadline (loop time) is spilled to disk instead of dropped."""
+    loop = asyncio.get_running_loop()
+    while len(buffered_logs) > 0:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        segments = buffered_logs.take(SHUTDOWN_BATCH_SIZE)
+
+        ok = False
+        try:
+            ok = await asyncio.wait_for(send_segments(segments), remaining)
+        except asyncio.TimeoutError:
+            logger.error("Shutdown deadline reached while sending logs")
+        except Exception as e:
+            logger.error(f"Unexpected send failure: {e}")
+
+        if ok:
+            count = sum(segment.count for segment in segments)
+            buffered_logs.ack(segments)
+            logger.info(f"Flushed {count} logs on shutdown")
+        else:
+            buffered_logs.nack(segments)
+            await asyncio.sleep(max(min(BACKOFF_INITIAL, deadline - loop.time()), 0))
+
+    if len(buffered_logs) > 0:
+        segments = buffered_logs.take()
+        spill_logs(segment_logs(segments))
+        buffered_logs.ack(segments)
+
+    if file_sink is not None:
+        file_sink.close()
+    if pool is not None:
+        await pool.close()
 
 
 def open_fifo(fifo_file):
@@ -294,13 +959,17 @@ class PIPE:
 
     fifo_file = None
 
+    @staticmethod
+    def open_nonblocking():
+        # O_NONBLOCK also keeps open() from blocking (and with it the event loop) until there is a writer
+        return os.fdopen(os.open(FIFO_PATH, os.O_RDONLY | os.O_NONBLOCK), mode="rb")
+
     def __enter__(self):
         try:
-            self.fifo_file = open(FIFO_PATH, mode="r")
+            self.fifo_file = self.open_nonblocking()
         except FileNotFoundError:
             open_fifo(FIFO_PATH)
-            self.fifo_file = open(FIFO_PATH, mode="r")
-        os.set_blocking(self.fifo_file.fileno(), False)
+            self.fifo_file = self.open_nonblocking()
         return self.fifo_file
 
     def __exit__(self, pipe_type, value, traceback):
@@ -309,11 +978,10 @@ class PIPE:
 
     async def __aenter__(self):
         try:
-            self.fifo_file = open(FIFO_PATH, mode="r")
+            self.fifo_file = self.open_nonblocking()
         except FileNotFoundError:
             open_fifo(FIFO_PATH)
-            self.fifo_file = open(FIFO_PATH, mode="r")
-        os.set_blocking(self.fifo_file.fileno(), False)
+            self.fifo_file = self.open_nonblocking()
         return await asyncio.sleep(-1, result=self.fifo_file)
 
     async def __aexit__(self, exc_type, exc, tb):
@@ -321,32 +989,330 @@ class PIPE:
             await asyncio.sleep(-1, result=self.fifo_file.close())
 
 
-async def collect_logs(buffered_logs: Buffer):
-    """Function that keeps running and collects logs from the named pipe"""
+class FrameDecoder:
+    """Decoder for the framed pipe protocol, which keeps large records from interleaving.
+    Every frame is a FRAME_HEADER followed by the payload: a JSON or msgpack encoded log, or a fragment of one.
+    Writers keep each frame within PIPE_BUF, so frames are written atomically and never interleave.
+    Records larger than that are split into fragments, which are reassembled per stream id (one per writer)."""
+
+    def __init__(self, max_record_bytes: int = MAX_RECORD_BYTES):
+        self.max_record_bytes = max_record_bytes
+        self.buf = bytearray()
+        self.partial: dict[int, bytearray] = {}
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        """Returns the payloads of all records completed by `chunk`."""
+        self.buf += chunk
+        records = []
+        pos = 0
+        while len(self.buf) - pos >= FRAME_HEADER.size:
+            magic, encoding, flags, stream_id, length = FRAME_HEADER.unpack_from(self.buf, pos)
+            if (
+                magic != FRAME_MAGIC or encoding not in (ENCODING_JSON, ENCODING_MSGPACK)
+                or length > MAX_FRAME_PAYLOAD
+            ):
+                # a corrupt length would otherwise hold back every following frame
+                resync = self.buf.find(FRAME_MAGIC, pos + 1)
+                logger.error("Cannot decode frame header, skipping to the next frame")
+                pos = resync if resync != -1 else len(self.buf) - 1
+                continue
+            end = pos + FRAME_HEADER.size + length
+            if end > len(self.buf):
+                break
+            payload = self.buf[pos + FRAME_HEADER.size:end]
+            pos = end
+
+            if not flags & FLAG_CONTINUATION and stream_id in self.partial:
+                logger.error(f"Dropped incomplete record of stream {stream_id}")
+                del self.partial[stream_id]
+            if flags & FLAG_CONTINUATION:
+                if stream_id not in self.partial:
+                    continue  # the start of this record was dropped
+                self.partial[stream_id] += payload
+                payload = self.partial[stream_id]
+                if len(payload) > self.max_record_bytes:
+                    logger.error(f"Dropped record of stream {stream_id} larger than {self.max_record_bytes} bytes")
+                    del self.partial[stream_id]
+                    continue
+            if flags & FLAG_MORE:
+                self.partial[stream_id] = payload
+                continue
+            self.partial.pop(stream_id, None)
+            records.append(bytes(payload))
+        del self.buf[:pos]
+        return records
+
+
+def pending_pipe_bytes(fd: int) -> int:
+    """Returns the number of bytes already written to the pipe but not read yet."""
+    count = array.array("i", [0])
+    fcntl.ioctl(fd, termios.FIONREAD, count, True)
+    return count[0]
+
+
+def ingest_line(data: bytes, buffered_logs: Buffer):
+    if buffered_logs.raw:
+        if MAX_DATA_BYTES and len(data) > MAX_DATA_BYTES:
+            # only lines longer than the cap can carry an oversized payload, cap it before the line is buffered
+            try:
+                log = decode_log(data)
+            except ValueError as e:
+                logger.error(f"Cannot decode log: {e}")
+                return
+            if isinstance(log, dict):
+                data = encode_log(log)
+        if is_msgpack(data):
+            buffered_logs.append(data)
+        elif data.strip():
+            buffered_logs.append(data if data.endswith(b"\n") else data + b"\n")
+        return
+    try:
+        log = decode_log(data)
+    except ValueError as e:
+        logger.error(f"Cannot decode log: {e}")
+        return
+    if log:
+        logger.debug("Collected a log")
+        buffered_logs.append(log)
+
+
+def drain_pipe(pipe, buffered_logs: Buffer, decoder: FrameDecoder | None = None):
+    """Reads whatever is in the pipe at the time of calling, but nothing written afterwards."""
+    drained = 0
+    if decoder is not None:
+        budget = pending_pipe_bytes(pipe.fileno())
+        while budget > 0:
+            chunk = os.read(pipe.fileno(), min(budget, READ_SIZE))
+            if len(chunk) == 0:
+                break
+            budget -= len(chunk)
+            for data in decoder.feed(chunk):
+                drained += 1
+                ingest_line(data, buffered_logs)
+    else:
+        # peek first, it may move bytes from the kernel into the reader
+        budget = len(pipe.peek(0) or b"")
+        budget += pending_pipe_bytes(pipe.fileno())
+        while budget > 0:
+            data = pipe.readline()
+            if len(data) == 0:
+                break
+            budget -= len(data)
+            drained += 1
+            ingest_line(data, buffered_logs)
+    logger.info(f"Drained {drained} logs from the pipe")
+
+
+def read_frames(pipe, decoder: FrameDecoder) -> list[bytes] | None:
+    """Reads the pipe without blocking. Returns None if there was nothing to read."""
+    try:
+        chunk = os.read(pipe.fileno(), READ_SIZE)
+    except BlockingIOError:
+        return None
+    if len(chunk) == 0:
+        return None
+    return decoder.feed(chunk)
+
+
+async def collect_logs(buffered_logs: Buffer, stopping: asyncio.Event):
+    """Function that keeps running and collects logs from the named pipe.
+    Once `stopping` is set, it drains what is left in the pipe and returns."""
+    decoder = FrameDecoder() if LOG_PIPE_PROTOCOL == "framed" else None
     async with PIPE() as pipe:
-        while True:
+        collected = 0
+        while not stopping.is_set():
             try:
-                data = pipe.readline()
-                if len(data) == 0:
-                    await asyncio.sleep(1)
-                    continue
-                try:
-                    log = json.loads(data)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Cannot decode log: {e}")
+                timed = stage_timer.enabled
+                if timed:
+                    read_at = time.perf_counter()
+                if decoder is not None:
+                    records = read_frames(pipe, decoder)
+                else:
+                    data = pipe.readline()
+                    records = [data] if len(data) > 0 else None
+                if records is None:
+                    await wait_or_stop(stopping, 1)
                     continue
-                if log:
-                    logger.debug("Collected a log")
-                    await buffered_logs.add(log)
+                if timed:
+                    ingest_at = time.perf_counter()
+                    stage_timer.add("read", ingest_at - read_at, len(records))
+                for data in records:
+                    ingest_line(data, buffered_logs)
+                if timed:
+                    stage_timer.add("ingest", time.perf_counter() - ingest_at, len(records))
+                collected += 1
+                if collected % 256 == 0 or len(records) > 1:
+                    # appending does not yield, let the sender run under sustained load
+                    await asyncio.sleep(0)
             except Exception as e:
                 logger.error(e)
+        try:
+            drain_pipe(pipe, buffered_logs, decoder)
+        except Exception as e:
+            logger.error(f"Failed to drain pipe: {e}")
+
+
+def bind_unix_socket(path: str, kind: int) -> socket.socket:
+    """Binds a non-blocking unix socket, replacing a socket file left by a previous run.
+    SO_RCVBUF does not apply to unix sockets: how much a stream socket queues is bounded by the writer's SO_SNDBUF
+    (see SocketWriter in test-api/logger.py), a datagram socket by net.unix.max_dgram_qlen (see check_datagram_queue)."""
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, kind)
+    sock.bind(path)
+    os.chmod(path, 0o777)
+    sock.setblocking(False)
+    logger.info(f"Listening on {path}")
+    return sock
+
+
+async def collect_stream(reader: asyncio.StreamReader, buffered_logs: Buffer):
+    """Collects logs of one stream socket connection, as lines or frames depending on LOG_PIPE_PROTOCOL."""
+    decoder = FrameDecoder() if LOG_PIPE_PROTOCOL == "framed" else None
+    buf = bytearray()
+    while True:
+        chunk = await reader.read(READ_SIZE)
+        if len(chunk) == 0:
+            return
+        if decoder is not None:
+            records = decoder.feed(chunk)
+        else:
+            buf += chunk
+            end = buf.rfind(b"\n")
+            if end == -1:
+                if len(buf) > MAX_RECORD_BYTES:
+                    logger.error(f"Dropped log line larger than {MAX_RECORD_BYTES} bytes")
+                    buf.clear()
+                continue
+            records = bytes(buf[:end]).split(b"\n")
+            del buf[:end + 1]
+        for data in records:
+            if data:
+                ingest_line(data, buffered_logs)
+
+
+def check_datagram_queue():
+    """Warns if the datagram socket can only queue a few logs. Its queue is bounded by net.unix.max_dgram_qlen
+    (10 by default, per network namespace), and writers drop logs once it is full."""
+    try:
+        qlen = int(Path(MAX_DGRAM_QLEN).read_text())
+    except (OSError, ValueError):
+        return
+    if qlen < DATAGRAM_BATCH:
+        logger.warning(
+            f"net.unix.max_dgram_qlen is {qlen}, so the datagram socket queues only about {qlen + 1} logs "
+            f"before writers drop them. Raise it to at least {DATAGRAM_BATCH} or use the stream socket"
+        )
+
+
+def receive_datagrams(sock: socket.socket, recv_buffer: bytearray, buffered_logs: Buffer, limit: int) -> int:
+    """Receives up to `limit` queued datagrams, each holding one log. Returns the number received."""
+    received = 0
+    with memoryview(recv_buffer) as view:
+        while received < limit:
+            try:
+                size = sock.recv_into(view)
+            except BlockingIOError:
+                break
+            received += 1
+            if size > 0:
+                ingest_line(bytes(view[:size]), buffered_logs)
+    return received
+
+
+async def collect_socket_logs(buffered_logs: Buffer, stopping: asyncio.Event):
+    """Optional unix socket endpoints next to the FIFO (SIDECAR_SOCKET):
+    - stream: <pipe>.sock, every connection gets its own reader task
+    - datagram: <pipe>.dgram, one log per datagram, received in batches of up to DATAGRAM_BATCH
+    Once `stopping` is set, no new connections are accepted and what is already queued is read."""
+    loop = asyncio.get_running_loop()
+    server = None
+    datagram_socket = None
+    recv_buffer = None
+    connections = set()
+
+    async def on_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        connections.add(task)
+        try:
+            await collect_stream(reader, buffered_logs)
+        except Exception as e:
+            logger.error(f"Stream socket connection failed: {e}")
+        finally:
+            connections.discard(task)
+            writer.close()
+
+    try:
+        if SOCKET_MODE in ("stream", "both"):
+            stream_socket = bind_unix_socket(STREAM_SOCKET_PATH, socket.SOCK_STREAM)
+            server = await asyncio.start_unix_server(on_connect, sock=stream_socket)
+        if SOCKET_MODE in ("datagram", "both"):
+            datagram_socket = bind_unix_socket(DATAGRAM_SOCKET_PATH, socket.SOCK_DGRAM)
+            check_datagram_queue()
+            recv_buffer = bytearray(MAX_DATAGRAM)
+            loop.add_reader(
+                datagram_socket.fileno(), receive_datagrams, datagram_socket, recv_buffer, buffered_logs, DATAGRAM_BATCH
+            )
+    except OSError as e:
+        logger.error(f"Failed to listen on unix socket: {e}")
+
+    await stopping.wait()
+
+    if server is not None:
+        server.close()
+        if connections:
+            # connections keep reading what is already queued for a moment
+            await asyncio.wait(set(connections), timeout=SOCKET_DRAIN_SECONDS)
+        for task in list(connections):
+            task.cancel()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(STREAM_SOCKET_PATH)
+    if datagram_socket is not None:
+        loop.remove_reader(datagram_socket.fileno())
+        drained = receive_datagrams(datagram_socket, recv_buffer, buffered_logs, limit=1_000_000)
+        logger.info(f"Drained {drained} logs from the datagram socket")
+        datagram_socket.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(DATAGRAM_SOCKET_PATH)
 
 
 async def main():
-    buffered_logs = Buffer(SENDING_INTERVAL)
+    if BUFFER_MODE == "raw":
+        max_segments = max(BUFFER_MAX_BYTES // SEGMENT_BYTES, 1)
+        buffered_logs = Buffer(SENDING_INTERVAL, max_segments=max_segments, segment_size=SEGMENT_BYTES, raw=True)
+    else:
+        max_segments = max(-(-BUFFER_MAX_SIZE // SEGMENT_SIZE), 1)
+        buffered_logs = Buffer(SENDING_INTERVAL, max_segments=max_segments, segment_size=SEGMENT_SIZE)
     v = os.getenv("VERSION", "unknown Version")
     logger.info(f"Starting Log Sidecar, version {v}")
-    return await asyncio.gather(collect_logs(buffered_logs), schedule_log_sending(buffered_logs))
+
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+    install_signal_handlers(loop)
+
+    collector = asyncio.create_task(collect_logs(buffered_logs, stopping))
+    socket_collector = asyncio.create_task(collect_socket_logs(buffered_logs, stopping))
+    sender = asyncio.create_task(schedule_log_sending(buffered_logs, stopping))
+    stop_signal = asyncio.create_task(stopping.wait())
+    await asyncio.wait({collector, sender, stop_signal}, return_when=asyncio.FIRST_COMPLETED)
+    stopping.set()
+
+    deadline = loop.time() + SHUTDOWN_DEADLINE
+    await asyncio.wait({collector, socket_collector})
+    for task in (collector, socket_collector):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Collector failed: {task.exception()}")
+    logger.warning(f"Shutting down. Flushing {len(buffered_logs)} buffered logs within {SHUTDOWN_DEADLINE}s")
+    try:
+        # give an in-flight send the chance to finish, the rest is flushed below
+        await asyncio.wait_for(sender, max(deadline - loop.time(), 0))
+    except asyncio.TimeoutError:
+        pass
+    except Exception as e:
+        logger.error(e)
+    await flush_on_shutdown(buffered_logs, deadline)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,135 @@
+import os
+import time
+import pstats
+import signal
+import asyncio
+import cProfile
+import logging
+import tracemalloc
+from datetime import datetime
+from collections import defaultdict
+from pathlib import Path
+
+logger = logging.getLogger("sidecar")
+
+STAGE_TIMING = os.environ.get("SIDECAR_STAGE_TIMING", "0") == "1"
+PROFILE_DIR = os.environ.get("SIDECAR_PROFILE_DIR", "/tmp/sidecarProfiles")
+PROFILE_SECONDS = float(os.environ.get("SIDECAR_PROFILE_SECONDS", 30.0))
+STAGE_REPORT_INTERVAL = float(os.environ.get("SIDECAR_STAGE_REPORT_INTERVAL", 60.0))  # seconds
+SLOW_FLUSH_MS = float(os.environ.get("SIDECAR_SLOW_FLUSH_MS", 1000.0))
+LARGE_BATCH = int(os.environ.get("SIDECAR_LARGE_BATCH", 5000))
+
+
+class StageTimer:
+    """Accumulates time spent per stage (read, ingest, prep, connect, insert).
+    Callers check `enabled` before taking timestamps, so it costs one attribute lookup when disabled.
+    Toggled at runtime with SIGUSR2."""
+
+    def __init__(self, enabled=STAGE_TIMING):
+        self.enabled = enabled
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.last_report = time.monotonic()
+
+    def add(self, stage: str, seconds: float, count: int = 1):
+        self.totals[stage] += seconds
+        self.counts[stage] += count
+
+    def report(self):
+        elapsed = time.monotonic() - self.last_report
+        stages = ", ".join(
+            f"{stage}={self.totals[stage] * 1000:.1f}ms/{self.counts[stage]}" for stage in self.totals
+        )
+        logger.warning(f"Stage timings over the last {elapsed:.0f}s: {stages or 'nothing measured'}")
+        self.totals.clear()
+        self.counts.clear()
+        self.last_report = time.monotonic()
+
+    def maybe_report(self):
+        if self.enabled and time.monotonic() - self.last_report >= STAGE_REPORT_INTERVAL:
+            self.report()
+
+    def toggle(self):
+        if self.enabled:
+            self.report()
+        else:
+            self.totals.clear()
+            self.counts.clear()
+            self.last_report = time.monotonic()
+        self.enabled = not self.enabled
+        logger.warning(f"Stage timing {'enabled' if self.enabled else 'disabled'}")
+
+
+stage_timer = StageTimer()
+
+
+def log_flush(count: int, stages: dict[str, float]):
+    """Logs a flush with its stage breakdown (seconds) if it was slow or large."""
+    if stage_timer.enabled:
+        for stage, seconds in stages.items():
+            stage_timer.add(stage, seconds, count)
+    total_ms = sum(stages.values()) * 1000
+    if total_ms < SLOW_FLUSH_MS and count < LARGE_BATCH:
+        return
+    breakdown = ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in stages.items())
+    kind = "Slow" if total_ms >= SLOW_FLUSH_MS else "Large"
+    logger.warning(f"{kind} flush of {count} logs took {total_ms:.1f}ms ({breakdown})")
+
+
+_profiling = False
+_profile_tasks = set()  # the event loop only keeps weak references to tasks
+
+
+async def capture_profile(seconds: float = PROFILE_SECONDS) -> Path | None:
+    """Runs cProfile and tracemalloc for `seconds` and writes the results to PROFILE_DIR:
+    - <name>.prof: cProfile stats, for use with pstats / snakeviz
+    - <name>.tracemalloc: tracemalloc snapshot, for use with tracemalloc.Snapshot.load
+    - <name>.txt: human readable summary of both"""
+    global _profiling
+    if _profiling:
+        logger.warning("Profile already running, ignoring trigger")
+        return None
+    _profiling = True
+
+    name = Path(PROFILE_DIR) / f"profile-{datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+    started_tracing = not tracemalloc.is_tracing()
+    profiler = cProfile.Profile()
+    logger.warning(f"Profiling for {seconds}s")
+    try:
+        if started_tracing:
+            tracemalloc.start(25)
+        profiler.enable()
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+        _profiling = False
+
+    try:
+        name.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(f"{name}.prof")
+        snapshot.dump(f"{name}.tracemalloc")
+        with open(f"{name}.txt", mode="w") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(50)
+            f.write("\nTop allocations:\n")
+            for stat in snapshot.statistics("lineno")[:50]:
+                f.write(f"{stat}\n")
+    except Exception as e:
+        logger.error(f"Failed to write profile {name}: {e}")
+        return None
+    logger.warning(f"Wrote profile to {name}.*")
+    return name
+
+
+def start_profile(loop: asyncio.AbstractEventLoop):
+    task = loop.create_task(capture_profile())
+    _profile_tasks.add(task)
+    task.add_done_callback(_profile_tasks.discard)
+
+
+def install_signal_handlers(loop: asyncio.AbstractEventLoop):
+    """SIGUSR1 takes a time boxed profile, SIGUSR2 toggles the stage timers."""
+    loop.add_signal_handler(signal.SIGUSR1, start_profile, loop)
+    loop.add_signal_handler(signal.SIGUSR2, stage_timer.toggle)
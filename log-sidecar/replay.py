@@ -0,0 +1,49 @@
+import os
+import sys
+import asyncio
+import logging
+import argparse
+
+from file_sink import REPLAYED_SUFFIX, find_segments, read_segment
+from main import send_logs_to_db
+
+log_level = os.environ.get("SIDECAR_LOG_LEVEL", logging.INFO)
+logger = logging.getLogger("sidecar")
+
+REPLAY_BATCH_SIZE = int(os.environ.get("SIDECAR_REPLAY_BATCH_SIZE", 5000))
+
+
+async def replay(paths: list[str], batch_size: int = REPLAY_BATCH_SIZE) -> bool:
+    """Bulk loads file sink segments and spill files into the DB, through the same insert path as the sidecar.
+    Replayed files are renamed to *.replayed, so they are not loaded twice.
+    Logs that are in the DB already are skipped, so a segment that failed halfway can simply be replayed again."""
+    for segment in find_segments(paths):
+        sent = 0
+        batch = []
+        for line in read_segment(segment):
+            batch.append(line)
+            if len(batch) >= batch_size:
+                if not await send_logs_to_db(batch, skip_duplicates=True):
+                    logger.error(f"Replay of {segment} failed after {sent} logs")
+                    return False
+                sent += len(batch)
+                batch = []
+        if batch:
+            if not await send_logs_to_db(batch, skip_duplicates=True):
+                logger.error(f"Replay of {segment} failed after {sent} logs")
+                return False
+            sent += len(batch)
+        os.replace(segment, segment.with_name(segment.name + REPLAYED_SUFFIX))
+        logger.info(f"Replayed {sent} logs from {segment}")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load log segment / spill files into the DB")
+    parser.add_argument("paths", nargs="+", help="segment files or directories containing them")
+    parser.add_argument("--batch-size", type=int, default=REPLAY_BATCH_SIZE)
+    args = parser.parse_args()
+    # importing main configured logging already (WARNING by default), replay reports its progress at info
+    logging.getLogger().setLevel(log_level)
+    logger.setLevel(log_level)
+    sys.exit(0 if asyncio.run(replay(args.paths, args.batch_size)) else 1)
@@ -0,0 +1,58 @@
+import os
+import re
+from functools import lru_cache
+
+ACCESS_LOG_TABLE = os.environ.get("ACCESS_LOG_TABLE", "access_logs")
+APPLICATION_LOG_TABLE = os.environ.get("APPLICATION_LOG_TABLE", "application_logs")
+LOG_TABLE_ROUTES = os.environ.get("LOG_TABLE_ROUTES", "")
+
+_SUFFIX = re.compile(r"^[a-z0-9_]+$")
+
+
+def parse_routes(routes: str) -> dict[tuple[str, str], str]:
+    """Parses routing rules of the form `application[/environment]=suffix`, separated by commas.
+    `*` matches any application or environment, e.g. `billing=billing,auth/PROD=auth_prod,*/DEV=dev`,
+    and a bare `*` (or `*/*`) catches everything no other rule matches.
+    Logs matching a rule go to `<ACCESS_LOG_TABLE>_<suffix>` and `<APPLICATION_LOG_TABLE>_<suffix>`."""
+    parsed = {}
+    for rule in routes.split(","):
+        rule = rule.strip()
+        if not rule:
+            continue
+        match, _, suffix = rule.partition("=")
+        application_name, _, environment_name = match.strip().partition("/")
+        suffix = suffix.strip()
+        if not application_name or not _SUFFIX.match(suffix):
+            raise ValueError(f"Invalid LOG_TABLE_ROUTES rule: {rule}. Use application[/environment]=suffix")
+        parsed[(application_name, environment_name or "*")] = suffix
+    return parsed
+
+
+ROUTES = parse_routes(LOG_TABLE_ROUTES)
+
+
+def table_suffix(application_name: str, environment_name: str) -> str | None:
+    """Returns the table suffix of the most specific matching rule, or None for the default tables."""
+    return (
+        ROUTES.get((application_name, environment_name))
+        or ROUTES.get((application_name, "*"))
+        or ROUTES.get(("*", environment_name))
+        or ROUTES.get(("*", "*"))
+    )
+
+
+def routed_tables(access_log_table: str, application_log_table: str) -> list[tuple[str, str]]:
+    """Returns all (access_log_table, application_log_table) pairs, the default ones first."""
+    suffixes = sorted(set(ROUTES.values()))
+    return [(access_log_table, application_log_table)] + [
+        (f"{access_log_table}_{suffix}", f"{application_log_table}_{suffix}") for suffix in suffixes
+    ]
+
+
+@lru_cache(maxsize=1024)
+def route(application_name: str, environment_name: str) -> tuple[str, str]:
+    """Returns the (access_log_table, application_log_table) to send logs of an application / environment to."""
+    suffix = table_suffix(application_name, environment_name)
+    if suffix is None:
+        return ACCESS_LOG_TABLE, APPLICATION_LOG_TABLE
+    return f"{ACCESS_LOG_TABLE}_{suffix}", f"{APPLICATION_LOG_TABLE}_{suffix}"
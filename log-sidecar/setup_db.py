@@ -4,12 +4,19 @@ import logging
 import asyncpg
 from asyncpg import Connection
 
+from routing import routed_tables
+
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-async def create_access_log_table(con: Connection, table_name: str) -> bool:
+def primary_key(space_partitioned: bool) -> str:
+    """Unique indexes of a hypertable need to include all of its partitioning columns"""
+    return "time, trace_id, application_name" if space_partitioned else "time, trace_id"
+
+
+async def create_access_log_table(con: Connection, table_name: str, space_partitioned: bool = False) -> bool:
     stmt = f"""CREATE TABLE IF NOT EXISTS {table_name} (
     time                   TIMESTAMP         NOT NULL,
     application_name       VARCHAR(20)       NOT NULL,
@@ -24,14 +31,14 @@ async def create_access_log_table(con: Connection, table_name: str) -> bool:
     duration               NUMERIC(9,3)      NOT NULL,
     response_size          INTEGER           NOT NULL,
     data                   JSONB             NULL,
-    PRIMARY KEY(time, trace_id)
+    PRIMARY KEY({primary_key(space_partitioned)})
     );"""
     result = await con.execute(stmt)
     logger.info(result)
     return True
 
 
-async def create_application_log_table(con: Connection, table_name: str) -> bool:
+async def create_application_log_table(con: Connection, table_name: str, space_partitioned: bool = False) -> bool:
     stmt = f"""CREATE TABLE IF NOT EXISTS {table_name} (
     time                   TIMESTAMP         NOT NULL,
     application_name       VARCHAR(20)       NOT NULL,
@@ -43,7 +50,7 @@ async def create_application_log_table(con: Connection, table_name: str) -> bool
     file_path              TEXT              NOT NULL,
     message                TEXT              NOT NULL,
     data                   JSONB             NULL,
-    PRIMARY KEY(time, trace_id)
+    PRIMARY KEY({primary_key(space_partitioned)})
     );"""
     result = await con.execute(stmt)
     logger.info(result)
@@ -74,6 +81,16 @@ async def create_hypertables(con: Connection, table_name: str, partitioning_inte
     return True
 
 
+async def create_space_partitions(con: Connection, table_name: str, partitions: int) -> bool:
+    """Adds a hash dimension on application_name, so that chunks only hold data of some of the applications.
+    This only works on empty hypertables."""
+    stmt = f"SELECT add_dimension('{table_name}', 'application_name', number_partitions => {partitions}, " \
+           f"if_not_exists => TRUE)"
+    result = await con.execute(stmt)
+    logger.info(result)
+    return True
+
+
 async def create_user(con: Connection, user: str, password: str) -> bool:
     stmt = f"""
               DO
@@ -119,6 +136,7 @@ async def setup_db() -> None:
     application_log_table = os.environ.get("APPLICATION_LOG_TABLE")
 
     partitioning_interval = os.environ.get("PARTITIONING_INTERVAL")
+    space_partitions = int(os.environ.get("SPACE_PARTITIONS", 0))
 
     try:
         conn = await asyncpg.connect(
@@ -135,17 +153,24 @@ async def setup_db() -> None:
         logger.error("Failed to establish DB connection.")
         raise e
 
-    await create_access_log_table(conn, access_log_table)
-    await create_application_log_table(conn, application_log_table)
+    await create_user(conn, log_db_user, log_db_password)
+
+    # the default tables plus one pair per LOG_TABLE_ROUTES suffix
+    for access_table, application_table in routed_tables(access_log_table, application_log_table):
+        await create_access_log_table(conn, access_table, space_partitions > 0)
+        await create_application_log_table(conn, application_table, space_partitions > 0)
 
-    await create_access_table_indices(conn, access_log_table)
-    await create_application_table_indices(conn, application_log_table)
+        await create_access_table_indices(conn, access_table)
+        await create_application_table_indices(conn, application_table)
 
-    await create_hypertables(conn, access_log_table, partitioning_interval)
-    await create_hypertables(conn, application_log_table, partitioning_interval)
+        await create_hypertables(conn, access_table, partitioning_interval)
+        await create_hypertables(conn, application_table, partitioning_interval)
 
-    await create_user(conn, log_db_user, log_db_password)
-    await give_user_permission(conn, access_log_table, log_db_user)
-    await give_user_permission(conn, application_log_table, log_db_user)
+        if space_partitions > 0:
+            await create_space_partitions(conn, access_table, space_partitions)
+            await create_space_partitions(conn, application_table, space_partitions)
+
+        await give_user_permission(conn, access_table, log_db_user)
+        await give_user_permission(conn, application_table, log_db_user)
 
     await conn.close()
@@ -68,7 +68,8 @@ async def pre_start():
 
 async def start():
     PIPEDIR.mkdir(parents=True, exist_ok=True)
-    await pre_start()
+    if os.environ.get("SIDECAR_SINK", "db").lower() != "file":
+        await pre_start()
     await main()
 
 
@@ -0,0 +1,237 @@
+"""Measures what LoggingHTTPMiddleware and NamedPipeHandler add to the latency of a request.
+
+Drives the FastAPI app in-process (like test/conftest.py) at a fixed concurrency, once per mode:
+- none: the app without LoggingHTTPMiddleware and with logging disabled, the baseline
+- middleware: LoggingHTTPMiddleware installed but logging disabled, i.e. the cost of the middleware itself
+- stdout: StreamHandler, as used outside of STAG / PROD / TEST (written to /dev/null)
+- fifo: NamedPipeHandler with a thread reading the pipe, like a healthy sidecar
+- fifo-stalled: NamedPipeHandler with a reader that never reads, so the pipe is full and logs are dropped
+
+Reports p50 / p99 latency per request, what each mode adds to the baseline, and the syscalls
+(open / write / close) per log record. Usage:
+    python benchmark.py --requests 5000 --concurrency 16 --path /log_hello
+"""
+import os
+import io
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import contextlib
+from collections import Counter
+
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+
+import logger as app_logger
+from main import fastapi
+
+MODES = ("none", "middleware", "stdout", "fifo", "fifo-stalled")
+
+counts = Counter()
+
+
+class CountingOs:
+    """Stands in for the os module in logger.py and counts the syscalls made per log record."""
+
+    def __getattr__(self, name):
+        return getattr(os, name)
+
+    @staticmethod
+    def open(*args, **kwargs):
+        counts["open"] += 1
+        return os.open(*args, **kwargs)
+
+    @staticmethod
+    def write(*args, **kwargs):
+        counts["write"] += 1
+        return os.write(*args, **kwargs)
+
+    @staticmethod
+    def close(*args, **kwargs):
+        counts["close"] += 1
+        return os.close(*args, **kwargs)
+
+
+class CountingFile(io.FileIO):
+    """Unbuffered file counting its writes, for the stdout handler."""
+
+    def write(self, b):
+        counts["write"] += 1
+        return super().write(b)
+
+
+def count_records(write_log):
+    def counted(named_pipe, log):
+        counts["records"] += 1
+        return write_log(named_pipe, log)
+    return counted
+
+
+class CountingHandler(logging.StreamHandler):
+    def emit(self, record):
+        counts["records"] += 1
+        super().emit(record)
+
+
+class PipeReader(threading.Thread):
+    """Reads the pipe like the sidecar does, or only holds it open if stalled."""
+
+    def __init__(self, path: str, stalled: bool):
+        super().__init__(daemon=True)
+        self.fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        self.stalled = stalled
+        self.running = True
+        if stalled:
+            fill_pipe(path)
+
+    def run(self):
+        while self.running and not self.stalled:
+            try:
+                if not os.read(self.fd, 65536):
+                    time.sleep(0.001)
+            except BlockingIOError:
+                time.sleep(0.001)
+
+    def stop(self):
+        self.running = False
+        if self.is_alive():
+            self.join()
+        os.close(self.fd)
+
+
+def fill_pipe(path: str):
+    """Fills the pipe up, so that every following write fails with EAGAIN."""
+    fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+    try:
+        while True:
+            os.write(fd, b"\n" * 4096)
+    except BlockingIOError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def logging_mode(mode: str, fifo: str):
+    """Configures logger.py for `mode`, restores it afterwards."""
+    logger = app_logger.logger
+    saved = (app_logger.ENV, app_logger.LOG_PIPE, app_logger.socket_writer, app_logger.write_log, app_logger.os)
+    saved_handlers = logger.handlers[:]
+    for handler in saved_handlers:
+        logger.removeHandler(handler)
+    reader = None
+    stream = None
+    app_logger.socket_writer = None
+    app_logger.os = CountingOs()
+    app_logger.write_log = count_records(saved[3])
+    try:
+        if mode in ("none", "middleware"):
+            app_logger.ENV = "DEV"
+            logger.disabled = True
+        elif mode == "stdout":
+            app_logger.ENV = "DEV"
+            stream = io.TextIOWrapper(CountingFile(os.devnull, "w"), write_through=True)
+            logger.addHandler(CountingHandler(stream))
+        else:
+            app_logger.ENV = "PROD"
+            app_logger.LOG_PIPE = fifo
+            reader = PipeReader(fifo, stalled=mode == "fifo-stalled")
+            reader.start()
+            logger.addHandler(app_logger.NamedPipeHandler(fifo))
+        yield
+    finally:
+        if reader is not None:
+            reader.stop()
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+        for handler in saved_handlers:
+            logger.addHandler(handler)
+        if stream is not None:
+            stream.close()
+        logger.disabled = False
+        app_logger.ENV, app_logger.LOG_PIPE, app_logger.socket_writer, app_logger.write_log, app_logger.os = saved
+
+
+def without_middleware(app: FastAPI) -> FastAPI:
+    """The same routes and exception handlers, but without the middleware.
+
+    The ValueError handler reads the trace id the middleware sets, so /log_error only works with it.
+    """
+    bare = FastAPI(title=app.title, version=app.version)
+    bare.router.routes = list(app.router.routes)
+    bare.exception_handlers.update(app.exception_handlers)
+    return bare
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(client: AsyncClient, path: str, requests: int, concurrency: int) -> list[float]:
+    """Sends `requests` requests from `concurrency` concurrent clients, returns the latencies in ms."""
+    latencies = []
+
+    async def worker(n: int):
+        for _ in range(n):
+            started = time.perf_counter()
+            await client.get(path)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    share, rest = divmod(requests, concurrency)
+    await asyncio.gather(*(worker(share + (i < rest)) for i in range(concurrency)))
+    return latencies
+
+
+async def bench(mode: str, fifo: str, args) -> dict:
+    app = without_middleware(fastapi) if mode == "none" else fastapi
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        # handlers print dropped logs, keep that out of the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), \
+                contextlib.redirect_stderr(devnull), logging_mode(mode, fifo):
+            await run(client, args.path, args.warmup, args.concurrency)
+            counts.clear()
+            started = time.perf_counter()
+            latencies = await run(client, args.path, args.requests, args.concurrency)
+            elapsed = time.perf_counter() - started
+    records = counts["records"]
+    return {
+        "mode": mode,
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "rps": args.requests / elapsed,
+        "records": records / args.requests,
+        "syscalls": sum(counts[call] for call in ("open", "write", "close")) / records if records else 0.0,
+    }
+
+
+def report(results: list[dict]):
+    baseline = next((result for result in results if result["mode"] == "none"), None)
+    print(f"{'mode':<14}{'p50 ms':>9}{'p99 ms':>9}{'+p50 ms':>9}{'+p99 ms':>9}{'req/s':>9}{'logs/req':>10}"
+          f"{'syscalls/log':>14}")
+    for result in results:
+        added_p50 = result["p50"] - baseline["p50"] if baseline else float("nan")
+        added_p99 = result["p99"] - baseline["p99"] if baseline else float("nan")
+        print(f"{result['mode']:<14}{result['p50']:>9.3f}{result['p99']:>9.3f}{added_p50:>9.3f}{added_p99:>9.3f}"
+              f"{result['rps']:>9.0f}{result['records']:>10.1f}{result['syscalls']:>14.1f}")
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        fifo = os.path.join(directory, "benchLogs")
+        os.mkfifo(fifo)
+        results = [await bench(mode, fifo, args) for mode in args.modes]
+    report(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Client side logging overhead per request")
+    parser.add_argument("--requests", type=int, default=5000, help="requests per mode")
+    parser.add_argument("--warmup", type=int, default=500, help="requests per mode before measuring")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--path", default="/log_hello", help="endpoint, /log_hello also writes an application log")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    asyncio.run(main(parser.parse_args()))
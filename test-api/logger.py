@@ -2,7 +2,11 @@ import typing
 import errno
 import json
 import os
+import select
+import socket
+import struct
 import sys
+import threading
 import traceback
 from datetime import datetime
 
@@ -12,6 +16,11 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import Response
 
+try:
+    import msgpack
+except ImportError:  # framed logs fall back to JSON payloads
+    msgpack = None
+
 
 RequestResponseEndpoint = typing.Callable[[Request], typing.Awaitable[Response]]
 DispatchFunction = typing.Callable[[Request, RequestResponseEndpoint], typing.Awaitable[Response]]
@@ -19,6 +28,137 @@ LOCAL_IP = "your_ip"
 LOG_PIPE = os.environ.get("NAMED_PIPE_FOLDER", "/tmp/namedPipes") + "/" + os.environ.get("NAMED_PIPE_FILE", "appLogs")
 APPLICATION_NAME = os.environ.get("APPLICATION_NAME", "some_app")
 ENV = os.environ.get("ENV", "DEV")
+LOG_PIPE_PROTOCOL = os.environ.get("LOG_PIPE_PROTOCOL", "ndjson").lower()  # ndjson | framed
+LOG_TRANSPORT = os.environ.get("LOG_TRANSPORT", "fifo").lower()  # fifo | stream | datagram
+LOG_SOCKET = LOG_PIPE + (".dgram" if LOG_TRANSPORT == "datagram" else ".sock")
+LOG_SOCKET_SNDBUF = int(os.environ.get("LOG_SOCKET_SNDBUF", 4 * 1024 * 1024))  # bytes, capped by net.core.wmem_max
+
+# Framed protocol, must match the log-sidecar's FrameDecoder
+FRAME_HEADER = struct.Struct(">2sBBII")  # magic, encoding, flags, stream id, payload length
+FRAME_MAGIC = b"LS"
+ENCODING_JSON = 0
+ENCODING_MSGPACK = 1
+FLAG_MORE = 1          # more fragments of this record follow
+FLAG_CONTINUATION = 2  # not the first fragment of this record
+MAX_FRAME_PAYLOAD = select.PIPE_BUF - FRAME_HEADER.size  # writes up to PIPE_BUF are atomic
+
+# Fragments of one record have to be written back to back, also from different threads
+_write_lock = threading.Lock()
+
+
+def _new_stream_id() -> None:
+    """Random id of this process in the framed protocol. Process ids are not unique across containers
+    sharing the pipe (every container has its own PID namespace), so a random one is drawn, again in forked workers."""
+    global _stream_id
+    _stream_id = int.from_bytes(os.urandom(4), "big")
+
+
+_new_stream_id()
+os.register_at_fork(after_in_child=_new_stream_id)
+
+
+def encode_frames(log: dict) -> list[bytes]:
+    """Encodes a log into frames of at most PIPE_BUF bytes. Every process has its own stream id,
+    so the sidecar can reassemble large records of different workers even if their fragments interleave."""
+    if msgpack is not None:
+        encoding, payload = ENCODING_MSGPACK, msgpack.packb(log, default=str)
+    else:
+        encoding, payload = ENCODING_JSON, json.dumps(log).encode()
+    stream_id = _stream_id
+    frames = []
+    for start in range(0, max(len(payload), 1), MAX_FRAME_PAYLOAD):
+        fragment = payload[start:start + MAX_FRAME_PAYLOAD]
+        flags = FLAG_CONTINUATION if start else 0
+        if start + MAX_FRAME_PAYLOAD < len(payload):
+            flags |= FLAG_MORE
+        frames.append(FRAME_HEADER.pack(FRAME_MAGIC, encoding, flags, stream_id, len(fragment)) + fragment)
+    return frames
+
+
+def write_log(named_pipe: str, log: dict) -> None:
+    """Writes a log to the named pipe, as JSON line or as frames depending on LOG_PIPE_PROTOCOL"""
+    if LOG_PIPE_PROTOCOL == "framed":
+        chunks = encode_frames(log)
+    else:
+        # we use newline to demarcate where one log event ends.
+        chunks = [(json.dumps(log) + "\n").encode()]
+    with _write_lock:
+        pipe = os.open(named_pipe, os.O_WRONLY | os.O_NONBLOCK | os.O_ASYNC)
+        try:
+            for chunk in chunks:
+                os.write(pipe, chunk)
+        finally:
+            os.close(pipe)
+
+
+class SocketWriter:
+    """Sends logs to the sidecar's unix stream or datagram socket (see LOG_TRANSPORT).
+    Keeps one non-blocking socket per process, so it never blocks the caller (the event loop, in the middleware):
+    like with the FIFO, the log is dropped right away (sending raises) while the sidecar is not listening
+    or its queue is full."""
+
+    def __init__(self, path=LOG_SOCKET, transport=LOG_TRANSPORT):
+        self.path = path
+        self.transport = transport
+        self.sock = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def encode(self, log: dict) -> bytes:
+        if self.transport == "datagram":
+            # one log per datagram, no framing needed
+            if LOG_PIPE_PROTOCOL == "framed" and msgpack is not None:
+                return msgpack.packb(log, default=str)
+            return json.dumps(log).encode()
+        if LOG_PIPE_PROTOCOL == "framed":
+            return b"".join(encode_frames(log))
+        return (json.dumps(log) + "\n").encode()
+
+    def connect(self) -> socket.socket:
+        # what a unix socket can queue for the sidecar is bounded by the writer's send buffer
+        kind = socket.SOCK_DGRAM if self.transport == "datagram" else socket.SOCK_STREAM
+        sock = socket.socket(socket.AF_UNIX, kind)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, LOG_SOCKET_SNDBUF)
+        sock.setblocking(False)
+        if kind == socket.SOCK_STREAM:
+            try:
+                # unix sockets connect right away, or fail with EAGAIN if the sidecar's backlog is full
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+        return sock
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def write(self, log: dict) -> None:
+        payload = self.encode(log)
+        with self.lock:
+            if self.sock is None or self.pid != os.getpid():
+                # (re)connect, also in forked workers, which must not share the parent's connection
+                self.sock = self.connect()
+                self.pid = os.getpid()
+            if self.transport == "datagram":
+                # EAGAIN if the sidecar's queue is full, the log is dropped
+                self.sock.sendto(payload, self.path)
+                return
+            try:
+                sent = self.sock.send(payload)
+            except BlockingIOError:
+                raise  # nothing was sent, the connection is still fine
+            except OSError:
+                self.close()
+                raise
+            if sent < len(payload):
+                # a partially sent line would corrupt the stream, start over with a new connection
+                self.close()
+                raise BlockingIOError(errno.EAGAIN, f"Sidecar socket full, dropped {len(payload) - sent} bytes")
+
+
+socket_writer = SocketWriter() if LOG_TRANSPORT in ("stream", "datagram") else None
 
 
 class LoggingHTTPMiddleware(BaseHTTPMiddleware):
@@ -73,13 +213,10 @@ class LoggingHTTPMiddleware(BaseHTTPMiddleware):
                     trace_id=trace_id,
                     time=time,
                 )
-                # we use newline to demarcate where one log event ends.
-                write_data = json.dumps(log)
-                write_data = write_data + "\n"
-                write_data = write_data.encode()
-                pipe = os.open(LOG_PIPE, os.O_WRONLY | os.O_NONBLOCK | os.O_ASYNC)
-                os.write(pipe, write_data)
-                os.close(pipe)
+                if socket_writer is not None:
+                    socket_writer.write(log)
+                else:
+                    write_log(LOG_PIPE, log)
             except OSError as e:
                 if e.errno == 6:
                     pass
@@ -139,6 +276,9 @@ class DictFormatter(logging.Formatter):
         return f"{type(exception_info[1]).__name__}: {str(exception_info[1])}"
 
     def format(self, record) -> str:
+        return json.dumps(self.format_dict(record))
+
+    def format_dict(self, record) -> dict:
         time = datetime.utcnow()
         trace_id = record.args["trace_id"] if "trace_id" in record.args else None
         username = record.args["username"] if "username" in record.args else None
@@ -153,7 +293,7 @@ class DictFormatter(logging.Formatter):
         elif isinstance(record.msg, Exception):
             record.exc_text = f"{type(record.msg).__name__}: {str(record.msg)}"
         message = record.exc_text if record.exc_text else record.getMessage()
-        log_dict = {
+        return {
             "type": self.type,
             "application_name": self.application_name,
             "environment_name": self.environment_name,
@@ -166,7 +306,6 @@ class DictFormatter(logging.Formatter):
             "host_ip": self.ip,
             "username": username,
         }
-        return json.dumps(log_dict)
 
 
 class NamedPipeHandler(logging.StreamHandler):
@@ -177,15 +316,31 @@ class NamedPipeHandler(logging.StreamHandler):
     def __init__(self, named_pipe=LOG_PIPE):
         logging.StreamHandler.__init__(self)
         self.fifo = open_fifo(named_pipe)
+        self.setFormatter(DictFormatter())
 
     def emit(self, record):
         try:
-            log_json_str = self.format(record)
-            write_data = log_json_str + "\n"
-            write_data = write_data.encode()
-            pipe = os.open(self.fifo, os.O_WRONLY | os.O_NONBLOCK | os.O_ASYNC)
-            os.write(pipe, write_data)
-            os.close(pipe)
+            write_log(self.fifo, self.formatter.format_dict(record))
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception as e:
+            print(str(e))
+            self.handleError(record)
+
+
+class UnixSocketHandler(logging.Handler):
+    """
+    A custom handler that emits logs to the sidecar's unix stream or datagram socket, an alternative to the fifo
+    """
+
+    def __init__(self, writer: SocketWriter = None):
+        logging.Handler.__init__(self)
+        self.writer = writer if writer is not None else SocketWriter()
+        self.setFormatter(DictFormatter())
+
+    def emit(self, record):
+        try:
+            self.writer.write(self.formatter.format_dict(record))
         except (KeyboardInterrupt, SystemExit):
             raise
         except Exception as e:
@@ -197,7 +352,7 @@ logger = logging.getLogger("test-app")
 
 if ENV in ["STAG", "PROD", "TEST"]:
     logger.setLevel(logging.INFO)
-    handler = NamedPipeHandler()
+    handler = UnixSocketHandler(socket_writer) if socket_writer is not None else NamedPipeHandler()
     handler.setFormatter(DictFormatter())
 else:
     handler = logging.StreamHandler(sys.stdout)
@@ -1,8 +1,13 @@
 import os
+import sys
+import importlib.util
 from asyncio import AbstractEventLoop
+from pathlib import Path
+from types import ModuleType
 from typing import AsyncGenerator, Generator
 
 import asyncpg
+import pytest
 import pytest_asyncio
 import asyncio
 
@@ -10,6 +15,9 @@ from asyncpg import Connection
 from httpx import AsyncClient, ASGITransport
 from main import fastapi
 
+# The log-sidecar folder, mounted into the test-api container by docker-compose.test.yml
+SIDECAR_DIR = os.environ.get("SIDECAR_DIR", str(Path(__file__).resolve().parents[2] / "log-sidecar"))
+
 
 # We need to create our own event loop for async testing.
 @pytest_asyncio.fixture(scope="session")
@@ -50,3 +58,16 @@ async def db_con() -> AsyncGenerator[Connection, None]:
         raise e
     finally:
         await con.close()
+
+
+@pytest.fixture(scope="session")
+def sidecar() -> ModuleType:
+    """The log-sidecar's main module, loaded as `sidecar_main` since `main` is the test API."""
+    if "sidecar_main" not in sys.modules:
+        sys.path.append(SIDECAR_DIR)
+        os.environ.setdefault("LOG_DB_PASSWORD", "unused")  # only checked to be set, the tests don't connect
+        spec = importlib.util.spec_from_file_location("sidecar_main", os.path.join(SIDECAR_DIR, "main.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["sidecar_main"] = module
+        spec.loader.exec_module(module)
+    return sys.modules["sidecar_main"]
@@ -0,0 +1,44 @@
+def fill(buffer, count: int, start: int = 0) -> None:
+    for i in range(start, start + count):
+        buffer.append({"i": i})
+
+
+def logs_of(segments) -> list[int]:
+    return [log["i"] for segment in segments for log in segment.logs()]
+
+
+def test_accepts_logs_while_segments_are_in_flight(sidecar) -> None:
+    buffer = sidecar.Buffer(max_segments=3, segment_size=2)
+    fill(buffer, 6)
+    in_flight = buffer.take()
+    assert logs_of(in_flight) == list(range(6))
+
+    fill(buffer, 6, start=6)
+    assert buffer.dropped == 0
+    assert len(buffer) == 12
+    buffer.ack(in_flight)
+    assert logs_of(buffer.take()) == list(range(6, 12))
+    assert buffer.allocated == 6
+
+
+def test_drops_oldest_waiting_segment_when_full(sidecar) -> None:
+    buffer = sidecar.Buffer(max_segments=3, segment_size=2)
+    fill(buffer, 2)
+    in_flight = buffer.take()
+    fill(buffer, 8, start=2)
+    assert buffer.dropped == 2
+    assert buffer.count == 6
+    buffer.nack(in_flight)
+    assert logs_of(buffer.take()) == [0, 1] + list(range(4, 10))
+    assert buffer.allocated <= 6
+
+
+def test_recycles_acked_segments(sidecar) -> None:
+    buffer = sidecar.Buffer(max_segments=2, segment_size=2)
+    for turn in range(5):
+        fill(buffer, 4, start=4 * turn)
+        segments = buffer.take()
+        assert logs_of(segments) == list(range(4 * turn, 4 * turn + 4))
+        buffer.ack(segments)
+    assert buffer.allocated == 2
+    assert len(buffer) == 0 and buffer.dropped == 0
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+
+def test_decodes_data_payload(sidecar) -> None:
+    log = sidecar.decode_log(b'{"type": "access", "data": {"a": [1, 2, {"b": null}]}, "trace_id": "t"}\n')
+    assert log["type"] == "access"
+    assert log["trace_id"] == "t"
+    assert json.loads(log["data"]) == {"a": [1, 2, {"b": None}]}
+
+
+def test_nested_data_keys(sidecar) -> None:
+    line = b'{"message": {"data": "inner"}, "type": "application", "data": {"data": {"data": 1}}}'
+    log = sidecar.decode_log(line)
+    assert log["message"] == {"data": "inner"}
+    assert json.loads(log["data"]) == {"data": {"data": 1}}
+
+
+def test_escaped_quotes(sidecar) -> None:
+    line = rb'{"message": "say \"data\": {", "data": {"q": "a\\\"b\"}", "data\"": 1}}'
+    log = sidecar.decode_log(line)
+    assert log["message"] == 'say "data": {'
+    assert json.loads(log["data"]) == {"q": 'a\\"b"}', 'data"': 1}
+
+
+@pytest.mark.parametrize("data", [b"null", b"{}", b"[]", b'""', b"false", b"0"])
+def test_empty_data_is_null(sidecar, data) -> None:
+    assert sidecar.decode_log(b'{"type": "access", "data": ' + data + b"}")["data"] is None
+
+
+def test_missing_data_is_null(sidecar) -> None:
+    assert sidecar.decode_log(b'{"type": "access"}')["data"] is None
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        b'{"type": "access", "data": {bad}}',
+        b'{"type": "access", "data": tru}',
+        b'{"type": "access", "data": {"a": }}',
+        b'{"type": "access", "data": 1 2}',
+        b'{"type": "access", "data": "unterminated}',
+        b'{"type": "access", "data": [1, 2}',
+    ],
+)
+def test_malformed_lines_are_rejected(sidecar, line) -> None:
+    with pytest.raises(ValueError):
+        sidecar.decode_log(line)
+
+
+@pytest.mark.parametrize("data", [b"NaN", b'{"a": Infinity}', b'{"a": "\\u0000"}'])
+def test_data_jsonb_cannot_store_is_null(sidecar, data) -> None:
+    log = sidecar.decode_log(b'{"type": "access", "data": ' + data + b"}")
+    assert log["type"] == "access"
+    assert log["data"] is None
+
+
+def test_prep_skips_malformed_lines(sidecar) -> None:
+    good = json.dumps({"type": "application", "message": "ok", "data": {"a": 1}}).encode()
+    access_logs, application_logs, count = sidecar.prep_logs([good, b'{"type": "application", "data": {bad}}'])
+    assert count == 1
+    assert sum(len(rows) for rows in application_logs.values()) == 1
+
+
+def test_raw_mode_caps_data_before_buffering(sidecar, monkeypatch) -> None:
+    monkeypatch.setattr(sidecar, "MAX_DATA_BYTES", 64)
+    monkeypatch.setattr(sidecar, "OVERSIZE_DATA", "truncate")
+    buffer = sidecar.Buffer(max_segments=4, segment_size=4096, raw=True)
+    short = b'{"type": "access", "data": {"a": 1}}\n'
+    sidecar.ingest_line(short, buffer)
+    sidecar.ingest_line(b'{"type": "access", "trace_id": "t", "data": {"payload": "' + b"x" * 1000 + b'"}}', buffer)
+    sidecar.ingest_line(b'{"type": "access", "data": ' + b"x" * 100, buffer)  # invalid and too long, dropped
+
+    [kept, capped] = [log for segment in buffer.take() for log in segment.logs()]
+    assert kept == short
+    assert len(capped) < 300
+    # decoded again before sending, the marker is kept as it is
+    log = sidecar.decode_log(capped)
+    assert log["trace_id"] == "t"
+    assert json.loads(log["data"])["truncated"] is True
+    assert json.loads(log["data"])["size"] == len(b'{"payload": "' + b"x" * 1000 + b'"}')
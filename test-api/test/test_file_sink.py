@@ -0,0 +1,88 @@
+import pytest
+
+
+@pytest.fixture
+def file_sink(sidecar):
+    """log-sidecar's file_sink module, importable once the sidecar is loaded."""
+    import file_sink
+
+    return file_sink
+
+
+def lines(start: int, count: int) -> list[bytes]:
+    return [b'{"i": %d}\n' % i for i in range(start, start + count)]
+
+
+def replayed(file_sink, directory) -> list[bytes]:
+    return [line for segment in file_sink.find_segments([str(directory)]) for line in file_sink.read_segment(segment)]
+
+
+def test_open_segment_is_part_until_closed(file_sink, tmp_path) -> None:
+    sink = file_sink.RollingFileSink(tmp_path, max_bytes=1024, max_age=60, compression="none", fsync="batch")
+    assert sink.write(lines(0, 3)) == sum(map(len, lines(0, 3)))
+    assert [path.name.endswith(".ndjson.part") for path in tmp_path.iterdir()] == [True]
+    assert file_sink.find_segments([str(tmp_path)]) == []
+
+    sink.close()
+    assert [path.name.endswith(".ndjson") for path in tmp_path.iterdir()] == [True]
+    assert replayed(file_sink, tmp_path) == lines(0, 3)
+
+
+def test_rotates_by_size(file_sink, tmp_path) -> None:
+    sink = file_sink.RollingFileSink(tmp_path, max_bytes=20, max_age=60, compression="none", fsync="never")
+    for start in range(0, 9, 3):
+        sink.write(lines(start, 3))
+    assert len(file_sink.find_segments([str(tmp_path)])) == 2
+    sink.close()
+    assert len(file_sink.find_segments([str(tmp_path)])) == 3
+    assert replayed(file_sink, tmp_path) == lines(0, 9)
+
+
+def test_rotates_by_age(file_sink, tmp_path) -> None:
+    sink = file_sink.RollingFileSink(tmp_path, max_bytes=1024, max_age=60, compression="none", fsync="rotate")
+    sink.write(lines(0, 2))
+    sink.maybe_rotate()
+    assert file_sink.find_segments([str(tmp_path)]) == []
+
+    sink.opened_at -= 61
+    sink.maybe_rotate()
+    assert replayed(file_sink, tmp_path) == lines(0, 2)
+    sink.maybe_rotate()  # nothing open, nothing to rotate
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+@pytest.mark.parametrize("compression, extension", [("gzip", ".ndjson.gz"), ("zstd", ".ndjson.zst")])
+def test_compressed_round_trip(file_sink, tmp_path, compression, extension) -> None:
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    sink = file_sink.RollingFileSink(tmp_path, max_bytes=1024, max_age=60, compression=compression, fsync="rotate")
+    sink.write(lines(0, 50))
+    sink.write(lines(50, 50))
+    sink.close()
+    [segment] = file_sink.find_segments([str(tmp_path)])
+    assert segment.name.endswith(extension)
+    assert list(file_sink.read_segment(segment)) == lines(0, 100)
+
+
+def test_zstd_falls_back_to_gzip(file_sink, tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(file_sink, "zstandard", None)
+    sink = file_sink.RollingFileSink(tmp_path, compression="zstd")
+    sink.write(lines(0, 1))
+    sink.close()
+    [segment] = file_sink.find_segments([str(tmp_path)])
+    assert segment.name.endswith(".ndjson.gz")
+
+
+def test_find_segments(file_sink, tmp_path) -> None:
+    archive, spill = tmp_path / "archive", tmp_path / "spill"
+    archive.mkdir()
+    spill.mkdir()
+    for name in ("b.ndjson", "a.ndjson.gz", "c.ndjson.part", "d.ndjson.replayed", "notes.txt"):
+        (archive / name).write_bytes(b'{"i": 0}\n')
+    (spill / "spill.ndjson").write_bytes(b'{"i": 1}\n\n')
+    single = tmp_path / "single.ndjson"
+    single.write_bytes(b'{"i": 2}\n')
+
+    found = file_sink.find_segments([str(archive), str(spill), str(single)])
+    assert [path.name for path in found] == ["a.ndjson.gz", "b.ndjson", "spill.ndjson", "single.ndjson"]
+    assert list(file_sink.read_segment(spill / "spill.ndjson")) == [b'{"i": 1}\n']
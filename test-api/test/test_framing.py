@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+
+import logger
+from logger import FRAME_HEADER, FRAME_MAGIC, ENCODING_JSON, FLAG_MORE, MAX_FRAME_PAYLOAD, encode_frames
+
+
+@pytest.fixture(params=["json", "msgpack"])
+def encoding(request, monkeypatch) -> str:
+    if request.param == "json":
+        monkeypatch.setattr(logger, "msgpack", None)
+    elif logger.msgpack is None:
+        pytest.skip("msgpack is not installed")
+    return request.param
+
+
+def frames_of(log: dict, stream_id: int, monkeypatch) -> list[bytes]:
+    monkeypatch.setattr(logger, "_stream_id", stream_id)
+    return encode_frames(log)
+
+
+def sized_log(payload_size: int) -> dict:
+    """A log whose encoded payload is exactly `payload_size` bytes."""
+    log = {"type": "application", "message": "x" * 300}
+    size = sum(FRAME_HEADER.unpack_from(frame)[4] for frame in encode_frames(log))
+    log["message"] += "x" * (payload_size - size)
+    return log
+
+
+def test_forked_workers_get_their_own_stream_id() -> None:
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_end, logger._stream_id.to_bytes(4, "big"))
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert int.from_bytes(os.read(read_end, 4), "big") != logger._stream_id
+    os.close(read_end)
+    os.close(write_end)
+
+
+def test_header_matches_sidecar(sidecar) -> None:
+    assert FRAME_HEADER.format == sidecar.FRAME_HEADER.format
+    assert FRAME_MAGIC == sidecar.FRAME_MAGIC
+    assert (logger.ENCODING_JSON, logger.ENCODING_MSGPACK) == (sidecar.ENCODING_JSON, sidecar.ENCODING_MSGPACK)
+    assert (logger.FLAG_MORE, logger.FLAG_CONTINUATION) == (sidecar.FLAG_MORE, sidecar.FLAG_CONTINUATION)
+    assert MAX_FRAME_PAYLOAD == sidecar.MAX_FRAME_PAYLOAD
+
+
+def test_interleaved_streams_round_trip(sidecar, encoding, monkeypatch) -> None:
+    first = {"type": "application", "message": "a" * 10000, "data": {"stream": 1}}
+    second = {"type": "access", "request_path": "/" + "b" * 7000, "data": {"stream": 2}}
+    first_frames = frames_of(first, 1, monkeypatch)
+    second_frames = frames_of(second, 2, monkeypatch)
+    assert len(first_frames) > 2 and len(second_frames) > 1
+    assert all(len(frame) <= FRAME_HEADER.size + MAX_FRAME_PAYLOAD for frame in first_frames + second_frames)
+
+    interleaved = []
+    for i in range(max(len(first_frames), len(second_frames))):
+        interleaved += first_frames[i:i + 1] + second_frames[i:i + 1]
+    decoder = sidecar.FrameDecoder()
+    # fed in odd sized chunks, like reads from the pipe
+    stream = b"".join(interleaved)
+    records = []
+    for start in range(0, len(stream), 1000):
+        records += decoder.feed(stream[start:start + 1000])
+
+    logs = [sidecar.decode_log(record) for record in records]
+    assert [log["type"] for log in logs] == ["access", "application"]
+    assert logs[0]["request_path"] == second["request_path"]
+    assert logs[1]["message"] == first["message"]
+    assert json.loads(logs[1]["data"]) == {"stream": 1}
+    assert not decoder.partial and not decoder.buf
+
+
+@pytest.mark.parametrize("extra, frames", [(0, 1), (1, 2)])
+def test_payload_of_max_frame_size(sidecar, encoding, extra, frames) -> None:
+    log = sized_log(MAX_FRAME_PAYLOAD + extra)
+    encoded = encode_frames(log)
+    assert len(encoded) == frames
+    assert bool(FRAME_HEADER.unpack_from(encoded[0])[2] & FLAG_MORE) == (frames > 1)
+    records = sidecar.FrameDecoder().feed(b"".join(encoded))
+    assert len(records) == 1 and len(records[0]) == MAX_FRAME_PAYLOAD + extra
+    assert sidecar.decode_log(records[0])["message"] == log["message"]
+
+
+def test_corrupt_length_resyncs(sidecar) -> None:
+    decoder = sidecar.FrameDecoder()
+    corrupt = FRAME_HEADER.pack(FRAME_MAGIC, ENCODING_JSON, 0, 1, 0xFFFFFFF0)
+    log = {"type": "application", "message": "after the corrupt header"}
+    records = decoder.feed(corrupt + b"".join(encode_frames(log)))
+    assert [sidecar.decode_log(record)["message"] for record in records] == [log["message"]]
+    assert len(decoder.buf) < FRAME_HEADER.size
+
+
+def test_msgpack_data_is_capped(sidecar, monkeypatch) -> None:
+    msgpack = pytest.importorskip("msgpack")
+    monkeypatch.setattr(sidecar, "MAX_DATA_BYTES", 16)
+    log = sidecar.decode_log(msgpack.packb({"type": "access", "data": {"payload": "x" * 100}}))
+    assert json.loads(log["data"])["truncated"] is True
+    assert sidecar.decode_log(msgpack.packb({"type": "access", "data": {"a": 1}}))["data"] == b'{"a": 1}'
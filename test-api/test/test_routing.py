@@ -0,0 +1,64 @@
+import pytest
+
+
+@pytest.fixture
+def routing(sidecar, monkeypatch):
+    """log-sidecar's routing module (importable once the sidecar is loaded), with its route cache cleared."""
+    import routing
+
+    monkeypatch.setattr(routing, "ACCESS_LOG_TABLE", "access_logs")
+    monkeypatch.setattr(routing, "APPLICATION_LOG_TABLE", "application_logs")
+    routing.route.cache_clear()
+    yield routing
+    routing.route.cache_clear()
+
+
+def use_routes(routing, monkeypatch, routes: str) -> None:
+    monkeypatch.setattr(routing, "ROUTES", routing.parse_routes(routes))
+    routing.route.cache_clear()
+
+
+def test_parse_routes(routing) -> None:
+    assert routing.parse_routes(" billing = billing , auth/PROD=auth_prod,*/DEV=dev,, ") == {
+        ("billing", "*"): "billing",
+        ("auth", "PROD"): "auth_prod",
+        ("*", "DEV"): "dev",
+    }
+    assert routing.parse_routes("") == {}
+
+
+@pytest.mark.parametrize("rule", ["billing", "=billing", "/PROD=prod", "billing=", "billing=Billing", "a=b-c", "a=b;"])
+def test_invalid_rules(routing, rule) -> None:
+    with pytest.raises(ValueError, match="Invalid LOG_TABLE_ROUTES rule"):
+        routing.parse_routes(rule)
+
+
+def test_most_specific_rule_wins(routing, monkeypatch) -> None:
+    use_routes(routing, monkeypatch, "*/PROD=prod,auth=auth,auth/PROD=auth_prod,*=all")
+    assert routing.route("auth", "PROD") == ("access_logs_auth_prod", "application_logs_auth_prod")
+    assert routing.route("auth", "DEV") == ("access_logs_auth", "application_logs_auth")
+    assert routing.route("billing", "PROD") == ("access_logs_prod", "application_logs_prod")
+    assert routing.route("billing", "DEV") == ("access_logs_all", "application_logs_all")
+
+
+@pytest.mark.parametrize("catch_all", ["*=all", "*/*=all"])
+def test_catch_all(routing, monkeypatch, catch_all) -> None:
+    use_routes(routing, monkeypatch, f"billing=billing,{catch_all}")
+    assert routing.route("foo", "PROD") == ("access_logs_all", "application_logs_all")
+    assert routing.route("billing", "PROD") == ("access_logs_billing", "application_logs_billing")
+
+
+def test_default_tables(routing, monkeypatch) -> None:
+    use_routes(routing, monkeypatch, "billing/PROD=billing")
+    assert routing.route("billing", "DEV") == ("access_logs", "application_logs")
+    assert routing.route("foo", "PROD") == ("access_logs", "application_logs")
+
+
+def test_routed_tables(routing, monkeypatch) -> None:
+    use_routes(routing, monkeypatch, "billing=billing,auth=shared,*/DEV=shared,*=all")
+    assert routing.routed_tables("access_logs", "application_logs") == [
+        ("access_logs", "application_logs"),
+        ("access_logs_all", "application_logs_all"),
+        ("access_logs_billing", "application_logs_billing"),
+        ("access_logs_shared", "application_logs_shared"),
+    ]